@@ -12,22 +12,125 @@ This allows you to see how multiple humans have rated each task.
 #   "python-dotenv",
 #   "pandas",
 #   "openpyxl",
+#   "xlsxwriter",
 #   "scipy",
 #   "statsmodels",
+#   "orjson",
+#   "pyarrow",
+#   "numba",
 # ]
 # ///
 
 import sqlite3
 import psycopg2
+from psycopg2.extras import RealDictCursor
 import os
+import re
+import ast
 import json
+import orjson
+import functools
+import io
+from collections import defaultdict
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
-from CreateDatabase import create_connection
+from DataManager import get_conn
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:  # optional, falls back to pd.read_csv
+    pa = None
+    pacsv = None
+    pq = None
+
+try:
+    from numba import njit
+except ImportError:  # optional, falls back to NumPy broadcasting
+    njit = None
+
+# xlsxwriter writes workbooks faster and with less memory than openpyxl.
+# constant_memory mode is not used: pandas writes cells column by column,
+# which that mode (row by row only) would silently drop.
+try:
+    import xlsxwriter  # noqa: F401
+
+    _EXCEL_ENGINE = "xlsxwriter"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
 
 load_dotenv()
 
+# Trailing commas before closing braces/brackets (see safe_json_parse)
+_RE_TRAIL_OBJ = re.compile(r",\s*}")
+_RE_TRAIL_ARR = re.compile(r",\s*]")
+
+# Python literals, matched outside double-quoted strings (see safe_json_parse)
+_PY_TO_JSON = {"True": "true", "False": "false", "None": "null"}
+_RE_PY_LITERAL = re.compile(r'("(?:[^"\\]|\\.)*")|\b(True|False|None)\b')
+
+# One row per completed task, joined with its result (results.id is the task id)
+_RESULTS_WITH_TASKS_SELECT = """
+SELECT 
+    t.task_number,
+    t.id as task_id,
+    t.prolific_id,
+    t.session_id,
+    t.time_allocated,
+    t.status,
+    r.json_string,
+    r.id as result_id
+FROM tasks t
+LEFT JOIN results r ON r.id = t.id AND r.prolific_id = t.prolific_id
+WHERE t.status = 'completed'
+"""
+_RESULTS_WITH_TASKS_QUERY = (
+    _RESULTS_WITH_TASKS_SELECT + "ORDER BY t.task_number, t.prolific_id\n"
+)
+
+# Task columns copied as-is into results_analysis.csv
+_EXPORT_COLUMNS = [
+    "task_number",
+    "task_id",
+    "prolific_id",
+    "session_id",
+    "time_allocated",
+    "status",
+]
+
+# Submission keys that identify the task rather than hold ratings
+_ID_KEYS = frozenset({"task_id", "prolific_pid", "session_id"})
+_SYSTEM_KEYS = _ID_KEYS | {"demographics"}
+
+# Sub-objects of the submission JSON whose fields become top-level columns
+_NESTED_PREFIXES = ("demographics_", "responses_")
+
+
+def _strip_nested_prefix(column):
+    """Maps e.g. demographics_age -> age after json_normalize(sep="_")."""
+    for prefix in _NESTED_PREFIXES:
+        if column.startswith(prefix):
+            return column[len(prefix) :]
+    return column
+
+
+# Generated _rating_items() flatteners, keyed by submission shape
+_FLATTENERS = {}
+
+@contextmanager
+def _get_conn(db_file="database.db"):
+    """
+    Borrow a raw database connection through DataManager.get_conn(): pooled
+    PostgreSQL, or its shared SQLite connection.
+    """
+    with get_conn(db_file) as conn:
+        yield conn.raw
+
 
 def safe_json_parse(json_string, task_id):
     """
@@ -37,130 +140,175 @@ def safe_json_parse(json_string, task_id):
     if not json_string:
         return None
 
-    # Strategy 1: Try direct JSON parsing
+    parsed = _parse(json_string)
+
+    if parsed is None:
+        # Log the problematic JSON for manual inspection
+        print(f"\n⚠️  WARNING: Could not parse JSON for task {task_id}")
+        print(f"JSON string preview (first 200 chars): {json_string[:200]}...")
+        print(f"JSON string preview (last 200 chars): ...{json_string[-200:]}")
+        print(f"JSON string length: {len(json_string)} characters")
+
+    return parsed
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse(json_string):
+    """
+    Parsing behind safe_json_parse(), cached on the raw string so identical
+    payloads share one parsed result. Callers must not mutate the result.
+    """
+    # Strategy 1: Try direct JSON parsing (orjson first, then the stdlib parser,
+    # which also accepts NaN/Infinity)
     try:
-        return json.loads(json_string)
-    except json.JSONDecodeError:
+        return orjson.loads(json_string)
+    except orjson.JSONDecodeError:
         pass
 
-    # Strategy 2: Try replacing single quotes with double quotes
     try:
-        return json.loads(json_string.replace("'", '"'))
+        return json.loads(json_string)
     except json.JSONDecodeError:
-        pass
+        return _slow_parse_fallback(json_string)
+
+
+def _slow_parse_fallback(json_string):
+    """
+    Fallback strategies for strings that are not valid JSON.
+    Each strategy is only tried when it could change the string.
+    """
+    # Strategy 2: Try replacing single quotes with double quotes
+    if "'" in json_string:
+        try:
+            return json.loads(json_string.replace("'", '"'))
+        except json.JSONDecodeError:
+            pass
 
     # Strategy 3: Try to fix common JSON issues
+    if _RE_TRAIL_OBJ.search(json_string) or _RE_TRAIL_ARR.search(json_string):
+        try:
+            # Remove any trailing commas before closing braces/brackets
+            fixed = _RE_TRAIL_ARR.sub("]", _RE_TRAIL_OBJ.sub("}", json_string))
+            return json.loads(fixed)
+        except json.JSONDecodeError:
+            pass
+
+    # Strategy 4: Python dict reprs - swap quotes and map True/False/None
+    fixed = _RE_PY_LITERAL.sub(
+        lambda m: m.group(1) or _PY_TO_JSON[m.group(2)], json_string.replace("'", '"')
+    )
     try:
-        # Remove any trailing commas before closing braces/brackets
-        import re
-
-        fixed = re.sub(r",\s*}", "}", json_string)
-        fixed = re.sub(r",\s*]", "]", fixed)
         return json.loads(fixed)
     except json.JSONDecodeError:
         pass
 
-    # Strategy 4: Try ast.literal_eval for Python dict strings
+    # Strategy 5: Fall back to ast.literal_eval for anything else Python-shaped
     try:
-        import ast
-
         return ast.literal_eval(json_string)
     except (ValueError, SyntaxError):
         pass
 
-    # Log the problematic JSON for manual inspection
-    print(f"\n⚠️  WARNING: Could not parse JSON for task {task_id}")
-    print(f"JSON string preview (first 200 chars): {json_string[:200]}...")
-    print(f"JSON string preview (last 200 chars): ...{json_string[-200:]}")
-    print(f"JSON string length: {len(json_string)} characters")
-
     return None
 
 
+def clear_cache():
+    """Drops all parsed submissions held by _parse()'s cache."""
+    _parse.cache_clear()
+
+
 def get_all_results_with_tasks():
     """
     Retrieves all results and joins them with their corresponding task information.
     Returns a list of dictionaries containing combined task and result data.
     """
     try:
-        conn = create_connection()
-        cursor = conn.cursor()
-
-        is_postgres = hasattr(conn, "server_version")
-
-        query = """
-        SELECT 
-            t.task_number,
-            t.id as task_id,
-            t.prolific_id,
-            t.session_id,
-            t.time_allocated,
-            t.status,
-            r.json_string
-        FROM tasks t
-        LEFT JOIN results r ON t.prolific_id = r.prolific_id AND t.task_number = (
-            SELECT CAST(r.json_string AS TEXT) 
-            FROM results r2 
-            WHERE r2.id = t.id
-        )
-        WHERE t.status = 'completed'
-        ORDER BY t.task_number, t.prolific_id
-        """
-
-        # Simpler query - join by ID
-        simple_query = """
-        SELECT 
-            t.task_number,
-            t.id as task_id,
-            t.prolific_id,
-            t.session_id,
-            t.time_allocated,
-            t.status,
-            r.json_string,
-            r.id as result_id
-        FROM tasks t
-        LEFT JOIN results r ON t.prolific_id = r.prolific_id
-        WHERE t.status = 'completed'
-        ORDER BY t.task_number, t.prolific_id
-        """
-
-        cursor.execute(simple_query)
-
-        if is_postgres:
-            columns = [desc[0] for desc in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        else:
-            cursor.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(simple_query)
-            results = [dict(row) for row in cursor.fetchall()]
+        with _get_conn() as conn:
+            is_postgres = hasattr(conn, "server_version")
+
+            if is_postgres:
+                # Server-side cursor: rows arrive in batches instead of one
+                # fetchall() copy of every json_string
+                cursor = conn.cursor(name="results_cur", cursor_factory=RealDictCursor)
+                cursor.itersize = 2000
+                cursor.execute(_RESULTS_WITH_TASKS_QUERY)
+                results = [dict(row) for row in cursor]
+            else:
+                cursor = conn.cursor()
+                # Set on the cursor, not the shared connection, before executing once
+                cursor.row_factory = sqlite3.Row
+                cursor.execute(_RESULTS_WITH_TASKS_QUERY)
+                results = [dict(row) for row in cursor.fetchall()]
+
+            return results
+
+    except (sqlite3.Error, psycopg2.Error) as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+def get_results_for_task(task_num):
+    """
+    Same rows as get_all_results_with_tasks(), filtered to a single task_number
+    in SQL so only that task's results are fetched.
+    """
+    try:
+        with _get_conn() as conn:
+            is_postgres = hasattr(conn, "server_version")
+            placeholder = "%s" if is_postgres else "?"
+            query = (
+                _RESULTS_WITH_TASKS_SELECT
+                + f"AND t.task_number = {placeholder}\nORDER BY t.prolific_id\n"
+            )
+
+            if is_postgres:
+                cursor = conn.cursor(name="task_results_cur", cursor_factory=RealDictCursor)
+                cursor.itersize = 2000
+                cursor.execute(query, (task_num,))
+                results = [dict(row) for row in cursor]
+            else:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                cursor.execute(query, (task_num,))
+                results = [dict(row) for row in cursor.fetchall()]
 
-        conn.close()
-        return results
+            return results
 
     except (sqlite3.Error, psycopg2.Error) as e:
         print(f"An error occurred: {e}")
         return None
 
 
-def group_results_by_task_number():
+def get_all_results_df():
+    """
+    Same rows as get_all_results_with_tasks(), read straight into a DataFrame.
+    """
+    try:
+        with _get_conn() as conn:
+            return pd.read_sql_query(_RESULTS_WITH_TASKS_QUERY, conn)
+
+    except (sqlite3.Error, psycopg2.Error, pd.errors.DatabaseError) as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+def group_results_by_task_number(all_results=None):
     """
     Groups all results by task_number to see multiple ratings for each task.
     Returns a dictionary where keys are task_numbers and values are lists of results.
+
+    Pass all_results to reuse rows already fetched by get_all_results_with_tasks().
     """
-    all_results = get_all_results_with_tasks()
+    if all_results is None:
+        all_results = get_all_results_with_tasks()
 
     if all_results is None:
         return None
 
-    grouped = {}
+    grouped = defaultdict(list)
     parse_errors = 0
     successful_parses = 0
 
     for result in all_results:
         task_num = result["task_number"]
-        if task_num not in grouped:
-            grouped[task_num] = []
 
         # Parse the JSON string to get the actual ratings
         if result["json_string"]:
@@ -178,66 +326,124 @@ def group_results_by_task_number():
     print(f"   ✅ Successfully parsed: {successful_parses}")
     print(f"   ❌ Parse errors: {parse_errors}")
 
-    return grouped
+    # Plain dict so callers still get KeyError on a missing task
+    return dict(grouped)
+
+
+def _schema_key(ratings):
+    responses = ratings.get("responses")
+    return (
+        frozenset(ratings),
+        frozenset(responses) if isinstance(responses, dict) else None,
+    )
 
 
-def export_to_csv(output_file="results_analysis.csv"):
+def _build_flattener(sample):
+    """
+    Generates a function returning the (key, value) rating pairs for every
+    submission shaped like sample, as one straight-line tuple expression.
+    """
+    pairs = []
+    for key, value in sample.items():
+        if key in _SYSTEM_KEYS:
+            continue
+        if key == "responses" and isinstance(value, dict):
+            pairs.extend(f"({item!r}, r[{key!r}][{item!r}])" for item in value)
+        else:
+            pairs.append(f"({key!r}, r[{key!r}])")
+
+    source = (
+        f"def _flatten(r):\n    return ({', '.join(pairs)}{',' if pairs else ''})\n"
+    )
+    namespace = {}
+    exec(compile(source, "<rating flattener>", "exec"), namespace)
+    return namespace["_flatten"]
+
+
+def _rating_items(ratings):
+    """
+    Returns (key, value) for every rating field of a parsed submission,
+    expanding the "responses" sub-object into its individual items.
+    Flatteners are generated once per distinct submission shape.
+    """
+    schema = _schema_key(ratings)
+    flatten = _FLATTENERS.get(schema)
+    if flatten is None:
+        flatten = _FLATTENERS[schema] = _build_flattener(ratings)
+    return flatten(ratings)
+
+
+def _rating_lists_file(csv_file):
+    return os.path.splitext(csv_file)[0] + "_ratings.parquet"
+
+
+def _write_rating_lists(lists, csv_file):
+    """
+    Stores the "_all" ratings of an aggregated export as list<double> columns
+    next to the CSV, so the analyses can read them without splitting strings.
+    Only written when every rating is a number, so both paths see the same data.
+    """
+    table = pa.table(
+        {
+            col: pa.array(
+                lists[col].tolist(), type=pa.list_(pa.float64()), from_pandas=True
+            )
+            for col in lists.columns
+        }
+    )
+    try:
+        pq.write_table(table, _rating_lists_file(csv_file), compression="zstd")
+    except OSError:
+        # The analyses fall back to parsing the CSV strings
+        pass
+
+
+def export_to_csv(output_file="results_analysis.csv", results_df=None):
     """
     Exports the results to a CSV file with one row per task completion.
+    Pass results_df to reuse a DataFrame already fetched by get_all_results_df().
     """
-    all_results = get_all_results_with_tasks()
+    if results_df is None:
+        results_df = get_all_results_df()
 
-    if all_results is None:
+    if results_df is None:
         print("No results to export.")
         return
 
-    # Prepare data for DataFrame
-    export_data = []
+    # Parse every JSON string; rows without usable ratings contribute {}
+    parsed_list = []
+    parse_error = []
     parse_errors = 0
     successful_exports = 0
 
-    for result in all_results:
-        row = {
-            "task_number": result["task_number"],
-            "task_id": result["task_id"],
-            "prolific_id": result["prolific_id"],
-            "session_id": result["session_id"],
-            "time_allocated": result["time_allocated"],
-            "status": result["status"],
-        }
+    for json_string, task_id in zip(results_df["json_string"], results_df["task_id"]):
+        ratings = None
+        failed = None
 
         # Parse JSON string to extract individual ratings
-        if result["json_string"]:
-            ratings = safe_json_parse(result["json_string"], result["task_id"])
+        if isinstance(json_string, str) and json_string:
+            ratings = safe_json_parse(json_string, task_id)
 
             if ratings:
                 successful_exports += 1
-
-                # Extract demographics if available
-                if "demographics" in ratings:
-                    row["gender"] = ratings["demographics"].get("gender", "")
-                    row["age"] = ratings["demographics"].get("age", "")
-                    row["english_proficiency"] = ratings["demographics"].get(
-                        "english_proficiency", ""
-                    )
-
-                # Extract all rating fields
-                for key, value in ratings.items():
-                    if key not in [
-                        "task_id",
-                        "prolific_pid",
-                        "session_id",
-                        "demographics",
-                    ]:
-                        row[key] = value
             else:
                 parse_errors += 1
-                row["parse_error"] = True
+                failed = True
+
+        parsed_list.append(ratings or {})
+        parse_error.append(failed)
+
+    # Flatten the demographics/responses sub-objects into columns in one call
+    flat = pd.json_normalize(parsed_list, sep="_")
+    flat = flat.drop(columns=[c for c in flat.columns if c in _ID_KEYS])
+    flat = flat.rename(columns=_strip_nested_prefix)
+    flat.index = results_df.index
 
-        export_data.append(row)
+    if parse_errors:
+        flat["parse_error"] = parse_error
 
     # Create DataFrame and export
-    df = pd.DataFrame(export_data)
+    df = pd.concat([results_df[_EXPORT_COLUMNS], flat], axis=1)
     df.to_csv(output_file, index=False)
     print(f"\n✅ Results exported to {output_file}")
     print(f"   Total rows: {len(df)}")
@@ -248,58 +454,93 @@ def export_to_csv(output_file="results_analysis.csv"):
     return df
 
 
-def export_aggregated_by_task(output_file="aggregated_results.csv"):
+def export_aggregated_by_task(output_file="aggregated_results.csv", all_results=None):
     """
     Exports aggregated statistics for each task showing how multiple participants rated it.
     """
-    grouped = group_results_by_task_number()
+    grouped = group_results_by_task_number(all_results=all_results)
 
     if grouped is None:
         print("No results to aggregate.")
         return
 
-    aggregated_data = []
+    if not grouped:
+        print("No results to aggregate.")
+        return
 
-    for task_num, results in grouped.items():
-        row = {
-            "task_number": task_num,
-            "num_completions": len(results),
-            "participants": ", ".join(
-                [r["prolific_id"] for r in results if r["prolific_id"]]
-            ),
+    all_rows = [result for results in grouped.values() for result in results]
+    valid_rows = [result for result in all_rows if result.get("parsed_ratings")]
+
+    results_df = pd.DataFrame(
+        {
+            "task_number": [result["task_number"] for result in all_rows],
+            "prolific_id": [result["prolific_id"] for result in all_rows],
+            "valid": [bool(result.get("parsed_ratings")) for result in all_rows],
         }
+    )
 
-        # Collect all ratings for this task
-        all_ratings = {}
-        valid_results = 0
-
-        for result in results:
-            if result.get("parsed_ratings"):
-                valid_results += 1
-                ratings = result["parsed_ratings"]
-                for key, value in ratings.items():
-                    if key not in [
-                        "task_id",
-                        "prolific_pid",
-                        "session_id",
-                        "demographics",
-                    ]:
-                        if key not in all_ratings:
-                            all_ratings[key] = []
-                        all_ratings[key].append(value)
-
-        row["valid_completions"] = valid_results
-
-        # Add rating lists to the row
-        for rating_key, rating_values in all_ratings.items():
-            row[f"{rating_key}_all"] = ", ".join([str(v) for v in rating_values])
-
-        aggregated_data.append(row)
+    # Long-form (task_number, rating_key, rating_value) table of every rating
+    long_rows = [
+        (result["task_number"], key, value)
+        for result in valid_rows
+        for key, value in _rating_items(result["parsed_ratings"])
+    ]
+    long_df = pd.DataFrame(
+        long_rows, columns=["task_number", "rating_key", "rating_value"]
+    )
+
+    df = results_df.groupby("task_number").agg(
+        num_completions=("prolific_id", "size"),
+        participants=(
+            "prolific_id",
+            lambda s: ", ".join([p for p in s.dropna() if p]),
+        ),
+        valid_completions=("valid", "sum"),
+    )
+
+    if len(long_df):
+        # Collect all ratings for each task, keeping keys in first-seen order
+        all_ratings = (
+            long_df.groupby(["task_number", "rating_key"], sort=False)["rating_value"]
+            .agg(lambda rating_values: ", ".join(rating_values.astype(str)))
+            .unstack()
+            .reindex(columns=long_df["rating_key"].unique())
+        )
+        all_ratings.columns = [
+            f"{rating_key}_all" for rating_key in all_ratings.columns
+        ]
+        df = df.join(all_ratings)
 
-    # Create DataFrame and export
-    df = pd.DataFrame(aggregated_data)
-    df = df.sort_values("task_number")
+    # groupby() already returns task_number in sorted order
+    df = df.reset_index()
     df.to_csv(output_file, index=False)
+
+    if pq is not None and len(long_df):
+        numeric = pd.to_numeric(long_df["rating_value"], errors="coerce")
+        # Ratings the CSV path cannot parse either; "" and "nan" read as missing
+        non_numeric = int(
+            (
+                numeric.isna()
+                & ~long_df["rating_value"].astype(str).str.lower().isin(["", "nan"])
+            ).sum()
+        )
+        if non_numeric:
+            # Storing them as nulls would let the analyses diverge from the CSV
+            print(
+                f"   ⚠️  {non_numeric} non-numeric ratings; "
+                f"not writing {_rating_lists_file(output_file)}"
+            )
+        else:
+            # The same ratings as float lists, aligned with the CSV rows
+            rating_lists = (
+                long_df.assign(rating_value=numeric)
+                .groupby(["task_number", "rating_key"], sort=False)["rating_value"]
+                .agg(list)
+                .unstack()
+                .reindex(index=df["task_number"], columns=long_df["rating_key"].unique())
+            )
+            rating_lists.columns = all_ratings.columns
+            _write_rating_lists(rating_lists, output_file)
     print(f"\n✅ Aggregated results exported to {output_file}")
     print(f"   Tasks with results: {len(df)}")
 
@@ -311,45 +552,51 @@ def diagnose_json_errors():
     Diagnostic function to identify and report all JSON parsing issues.
     """
     try:
-        conn = create_connection()
-        cursor = conn.cursor()
-
-        query = """
-        SELECT id, prolific_id, json_string
-        FROM results
-        """
-
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
-
-        print("\n🔍 JSON Diagnostic Report")
-        print("=" * 80)
-
-        total = len(results)
-        errors = []
-
-        for row in results:
-            result_id = row[0]
-            prolific_id = row[1]
-            json_string = row[2]
-
-            parsed = safe_json_parse(json_string, result_id)
-            if parsed is None and json_string:
-                errors.append(
-                    {
-                        "id": result_id,
-                        "prolific_id": prolific_id,
-                        "json_preview": json_string[:100] if json_string else "None",
-                    }
-                )
+        with _get_conn() as conn:
+            if hasattr(conn, "server_version"):
+                # Server-side cursor: rows are streamed in batches, not fetched at once
+                cursor = conn.cursor(name="diag_cur")
+                cursor.itersize = 2000
+            else:
+                cursor = conn.cursor()
+
+            query = """
+            SELECT id, prolific_id, json_string
+            FROM results
+            """
+
+            cursor.execute(query)
+
+            print("\n🔍 JSON Diagnostic Report")
+            print("=" * 80)
+
+            total = 0
+            error_count = 0
+            errors = []  # Only the first 10 are kept for display
+
+            for result_id, prolific_id, json_string in cursor:
+                total += 1
+
+                parsed = safe_json_parse(json_string, result_id)
+                if parsed is None and json_string:
+                    error_count += 1
+                    if len(errors) < 10:
+                        errors.append(
+                            {
+                                "id": result_id,
+                                "prolific_id": prolific_id,
+                                "json_preview": json_string[:100],
+                            }
+                        )
+
+            cursor.close()
 
         print(f"\nTotal records: {total}")
-        print(f"Parse errors: {len(errors)}")
+        print(f"Parse errors: {error_count}")
 
         if errors:
             print(f"\n❌ Records with JSON errors:")
-            for err in errors[:10]:  # Show first 10 errors
+            for err in errors:  # Show first 10 errors
                 print(f"\n   ID: {err['id']}")
                 print(f"   Prolific ID: {err['prolific_id']}")
                 print(f"   JSON Preview: {err['json_preview']}...")
@@ -362,13 +609,17 @@ def print_task_summary(task_number):
     """
     Prints a detailed summary of all ratings for a specific task.
     """
-    grouped = group_results_by_task_number()
+    results = get_results_for_task(task_number)
 
-    if grouped is None or task_number not in grouped:
+    if not results:
         print(f"No results found for task {task_number}")
         return
 
-    results = grouped[task_number]
+    for result in results:
+        if result["json_string"]:
+            result["parsed_ratings"] = safe_json_parse(
+                result["json_string"], result["task_id"]
+            )
 
     print(f"\n{'=' * 60}")
     print(f"TASK NUMBER: {task_number}")
@@ -384,7 +635,7 @@ def print_task_summary(task_number):
         if result.get("parsed_ratings"):
             print(f"  Ratings:")
             for key, value in result["parsed_ratings"].items():
-                if key not in ["task_id", "prolific_pid", "session_id"]:
+                if key not in _ID_KEYS:
                     print(f"    {key}: {value}")
         else:
             print(f"  ⚠️  No valid ratings data available")
@@ -396,7 +647,190 @@ def print_task_summary(task_number):
 # ============================================================================
 
 
-def calculate_average_ratings_per_task(csv_file="results_analysis.csv"):
+def _grammar_columns(columns):
+    """Returns (grammar-item rating columns, the aggregated "_all" ones among them)."""
+    grammar_cols = [col for col in columns if col.startswith("grammar-item")]
+    grammar_all_cols = [col for col in grammar_cols if col.endswith("_all")]
+    return grammar_cols, grammar_all_cols
+
+
+# pd.read_csv's default na_values, so Arrow reads the same cells as missing
+_CSV_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def _nan_nulls(df):
+    """Arrow nulls come back as None in object columns; read_csv uses NaN."""
+    obj_cols = df.select_dtypes(include="object").columns
+    if len(obj_cols):
+        df[obj_cols] = df[obj_cols].where(df[obj_cols].notna(), np.nan)
+    return df
+
+
+def _parse_csv(csv_file):
+    """
+    Parses a CSV with PyArrow's multi-threaded reader, yielding the same values
+    and dtypes as pd.read_csv(); falls back to pandas if Arrow rejects the file.
+    """
+    try:
+        table = pacsv.read_csv(
+            csv_file,
+            convert_options=pacsv.ConvertOptions(
+                # Arrow would otherwise turn this text column into timestamps
+                column_types={"time_allocated": pa.string()},
+                null_values=_CSV_NULL_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+    except pa.ArrowInvalid:
+        return pd.read_csv(csv_file)
+    return _nan_nulls(table.to_pandas())
+
+
+def _read_export(csv_file):
+    """
+    Reads an exported CSV, preferring a Parquet copy written after it.
+    The first CSV parse saves that copy, so later runs skip text parsing.
+    """
+    parquet_file = os.path.splitext(csv_file)[0] + ".parquet"
+    if pa is None:
+        return pd.read_csv(csv_file)
+
+    try:
+        if os.stat(parquet_file).st_mtime_ns >= os.stat(csv_file).st_mtime_ns:
+            return _nan_nulls(pd.read_parquet(parquet_file, engine="pyarrow", memory_map=True))
+    except (OSError, pa.ArrowException):
+        pass
+
+    df = _parse_csv(csv_file)
+    try:
+        df.to_parquet(parquet_file, engine="pyarrow", compression="zstd", index=False)
+    except (OSError, pa.ArrowException):
+        # Columns mixing Python types cannot be stored; keep using the CSV
+        pass
+    return df
+
+
+def _ratings_block(df, cols):
+    """
+    The per-response rating columns as one dense (responses, items) float
+    matrix, NaN where a rating is missing.
+    """
+    return np.ascontiguousarray(df[cols].to_numpy(dtype=np.float64))
+
+
+def _read_rating_lists(csv_file, num_rows):
+    """
+    The {column: list<double> array} ratings saved with an aggregated export,
+    or None if they are missing, older than the CSV or do not match its rows.
+    """
+    lists_file = _rating_lists_file(csv_file)
+    try:
+        if os.stat(lists_file).st_mtime_ns < os.stat(csv_file).st_mtime_ns:
+            return None
+        table = pq.read_table(lists_file, memory_map=True)
+    except (OSError, pa.ArrowException):
+        return None
+    if table.num_rows != num_rows:
+        return None
+    return {name: table.column(name).combine_chunks() for name in table.column_names}
+
+
+@functools.lru_cache(maxsize=4)
+def _read_csv_cached(csv_file, mtime_ns, size):
+    df = _read_export(csv_file)
+    grammar_cols, grammar_all_cols = _grammar_columns(df.columns)
+
+    # Dense ratings for the per-response export, float lists for the aggregated one
+    ratings = None
+    if grammar_cols and not grammar_all_cols:
+        try:
+            ratings = _ratings_block(df, grammar_cols)
+        except (ValueError, TypeError):
+            pass
+    elif grammar_all_cols and pq is not None:
+        ratings = _read_rating_lists(csv_file, len(df))
+    return df, grammar_cols, grammar_all_cols, ratings
+
+
+def _load(csv_file, df=None, cols=None, ratings=None):
+    """
+    Returns (df, grammar_cols, grammar_all_cols, ratings), reading csv_file
+    through a cache keyed by the file's modification time unless df is given,
+    so each export is parsed, its columns scanned and its rating block
+    extracted once across all analyses. cols, when given alongside df, is
+    returned for both column lists; ratings (the per-response matrix, or the
+    {column: list<double>} ratings of an aggregated export) is None unless
+    cached or given.
+    Callers must not mutate the returned DataFrame, lists or matrix.
+    """
+    if df is not None:
+        if cols is not None:
+            return df, cols, cols, ratings
+        return (df, *_grammar_columns(df.columns), ratings)
+    stat = os.stat(csv_file)
+    return _read_csv_cached(csv_file, stat.st_mtime_ns, stat.st_size)
+
+
+def _nanmean_rows(ratings):
+    """
+    Per-row mean of a ratings block, skipping missing ratings like
+    DataFrame.mean(axis=1) but as one NumPy reduction.
+    """
+    with warnings.catch_warnings():
+        # Rows without any rating average to NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(ratings, axis=1)
+
+
+def _ratings_matrix(column):
+    """
+    Splits an aggregated "_all" column ("1, 4, 5" per task) into a float
+    matrix with one row per task, padded with NaN.
+    """
+    return (
+        column.astype(str)
+        .str.split(", ", expand=True)
+        .replace({"": np.nan, "nan": np.nan, None: np.nan})
+        .astype(float)
+        .to_numpy()
+    )
+
+
+def _list_rows(lists):
+    """
+    Row index and position within the row of every value of a list array,
+    plus whether each value is null.
+    """
+    lengths = lists.value_lengths().fill_null(0).to_numpy()
+    rows = np.repeat(np.arange(len(lists)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(rows)) - np.repeat(starts, lengths)
+    return rows, positions, lengths.max(initial=0)
+
+
+def _list_matrix(lists):
+    """
+    Pads a list<double> ratings array into a float matrix with one row per
+    task, NaN for nulls and padding; like _ratings_matrix() without parsing.
+    """
+    rows, positions, width = _list_rows(lists)
+    matrix = np.full((len(lists), width), np.nan)
+    matrix[rows, positions] = lists.flatten().to_numpy(zero_copy_only=False)
+    return matrix
+
+
+def _all_matrix(agg_df, col, ratings):
+    if ratings is not None and col in ratings:
+        return _list_matrix(ratings[col])
+    return _ratings_matrix(agg_df[col])
+
+
+def calculate_average_ratings_per_task(
+    csv_file="results_analysis.csv", df=None, cols=None
+):
     """
     Calculate average ratings per task for all grammar items.
 
@@ -405,11 +839,8 @@ def calculate_average_ratings_per_task(csv_file="results_analysis.csv"):
     """
     print("\n📊 Calculating Average Ratings per Task...")
 
-    # Load the detailed results
-    df = pd.read_csv(csv_file)
-
-    # Get all grammar rating columns
-    grammar_cols = [col for col in df.columns if col.startswith("grammar-item")]
+    # Load the detailed results and its grammar rating columns
+    df, grammar_cols, _, _ = _load(csv_file, df, cols)
 
     if not grammar_cols:
         print("❌ No grammar rating columns found!")
@@ -436,7 +867,9 @@ def calculate_average_ratings_per_task(csv_file="results_analysis.csv"):
     return task_means
 
 
-def analyze_inter_annotator_agreement(csv_file="aggregated_results.csv"):
+def analyze_inter_annotator_agreement(
+    csv_file="aggregated_results.csv", df=None, cols=None, ratings=None
+):
     """
     Analyze inter-annotator agreement for each grammar item.
     Calculates standard deviation and coefficient of variation.
@@ -446,45 +879,56 @@ def analyze_inter_annotator_agreement(csv_file="aggregated_results.csv"):
     """
     print("\n📊 Analyzing Inter-Annotator Agreement...")
 
-    # Load aggregated results
-    agg_df = pd.read_csv(csv_file)
-
-    agreement_data = []
+    # Load aggregated results, its "_all" rating columns and their float lists
+    agg_df, _, grammar_all_cols, rating_lists = _load(csv_file, df, cols, ratings)
 
-    for idx, row in agg_df.iterrows():
-        task_num = row["task_number"]
-
-        # Process each grammar item
-        for col in agg_df.columns:
-            if col.endswith("_all") and col.startswith("grammar-item"):
-                item_name = col.replace("_all", "")
+    if not grammar_all_cols:
+        print("❌ No rating data found!")
+        return None
 
-                if pd.notna(row[col]):
-                    # Parse ratings
-                    ratings = [float(x) for x in str(row[col]).split(", ") if x.strip()]
+    # (task, item, rating) cube flattened to one row per task-item pair,
+    # in task-major order
+    matrices = [_all_matrix(agg_df, col, rating_lists) for col in grammar_all_cols]
+    width = max(matrix.shape[1] for matrix in matrices)
+    cube = np.full((len(agg_df), len(grammar_all_cols), width), np.nan)
+    for j, matrix in enumerate(matrices):
+        cube[:, j, : matrix.shape[1]] = matrix
+    ratings = cube.reshape(-1, width)
 
-                    if ratings:
-                        agreement_data.append(
-                            {
-                                "task_number": task_num,
-                                "item": item_name,
-                                "mean": np.mean(ratings),
-                                "std": np.std(ratings, ddof=1),
-                                "cv": np.std(ratings, ddof=1) / np.mean(ratings)
-                                if np.mean(ratings) > 0
-                                else 0,
-                                "min": min(ratings),
-                                "max": max(ratings),
-                                "range": max(ratings) - min(ratings),
-                                "num_ratings": len(ratings),
-                            }
-                        )
+    counts = (~np.isnan(ratings)).sum(axis=1)
+    has_ratings = counts > 0
 
-    if not agreement_data:
+    if not has_ratings.any():
         print("❌ No rating data found!")
         return None
 
-    agreement_df = pd.DataFrame(agreement_data)
+    ratings = ratings[has_ratings]
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Single-rating tasks have an undefined (NaN) sample std
+        warnings.simplefilter("ignore", RuntimeWarning)
+        means = np.nanmean(ratings, axis=1)
+        stds = np.nanstd(ratings, axis=1, ddof=1)
+        cvs = np.where(means > 0, stds / means, 0)
+    mins = np.nanmin(ratings, axis=1)
+    maxs = np.nanmax(ratings, axis=1)
+
+    items = np.array(
+        [col.replace("_all", "") for col in grammar_all_cols], dtype=object
+    )
+    task_numbers = np.repeat(agg_df["task_number"].to_numpy(), len(items))
+    agreement_df = pd.DataFrame(
+        {
+            "task_number": task_numbers[has_ratings],
+            "item": np.tile(items, len(agg_df))[has_ratings],
+            "mean": means,
+            "std": stds,
+            "cv": cvs,
+            "min": mins,
+            "max": maxs,
+            "range": maxs - mins,
+            "num_ratings": counts[has_ratings],
+        }
+    )
 
     print(f"✅ Analyzed {len(agreement_df)} task-item combinations")
     print(f"\nAgreement Summary:")
@@ -499,30 +943,35 @@ def analyze_inter_annotator_agreement(csv_file="aggregated_results.csv"):
     return agreement_df
 
 
-def identify_problematic_tasks(csv_file="results_analysis.csv", threshold=4.0):
+def identify_problematic_tasks(
+    csv_file="results_analysis.csv", threshold=4.0, df=None, cols=None, ratings=None
+):
     """
     Identify tasks with low average grammaticality ratings.
 
     Args:
         csv_file: Path to results CSV file
         threshold: Rating threshold below which tasks are considered problematic
+        df: Already loaded results DataFrame (read from csv_file if omitted)
+        cols: Grammar rating columns of df (detected if omitted)
+        ratings: df[cols] as a float matrix (extracted if omitted)
 
     Returns:
         DataFrame with problematic tasks
     """
     print(f"\n🔍 Identifying Problematic Tasks (threshold < {threshold})...")
 
-    df = pd.read_csv(csv_file)
-
-    # Get all grammar rating columns
-    grammar_cols = [col for col in df.columns if col.startswith("grammar-item")]
+    df, grammar_cols, _, ratings = _load(csv_file, df, cols, ratings)
 
     if not grammar_cols:
         print("❌ No grammar rating columns found!")
         return None
 
+    if ratings is None:
+        ratings = _ratings_block(df, grammar_cols)
+
     # Calculate average grammar rating for each row
-    df["avg_grammar"] = df[grammar_cols].mean(axis=1)
+    df = df.assign(avg_grammar=_nanmean_rows(ratings))
 
     # Filter problematic tasks
     low_quality = df[df["avg_grammar"] < threshold][
@@ -554,7 +1003,17 @@ def identify_problematic_tasks(csv_file="results_analysis.csv", threshold=4.0):
     return low_quality
 
 
-def analyze_by_demographics(csv_file="results_analysis.csv"):
+# Demographic columns analysed by analyze_by_demographics(), with their headings
+_DEMOGRAPHIC_GROUPS = (
+    ("age", "📈 By Age Group:"),
+    ("gender", "👥 By Gender:"),
+    ("english_proficiency", "🗣️ By English Proficiency:"),
+)
+
+
+def analyze_by_demographics(
+    csv_file="results_analysis.csv", df=None, cols=None, ratings=None
+):
     """
     Analyze ratings by demographic groups (age, gender, English proficiency).
 
@@ -563,52 +1022,46 @@ def analyze_by_demographics(csv_file="results_analysis.csv"):
     """
     print("\n📊 Analyzing Ratings by Demographics...")
 
-    df = pd.read_csv(csv_file)
-
-    # Get all grammar rating columns
-    grammar_cols = [col for col in df.columns if col.startswith("grammar-item")]
+    df, grammar_cols, _, ratings = _load(csv_file, df, cols, ratings)
 
     if not grammar_cols:
         print("❌ No grammar rating columns found!")
         return None
 
+    if ratings is None:
+        ratings = _ratings_block(df, grammar_cols)
+
+    # Demographic columns present in this export, grouped on as categoricals
+    groups = [
+        (col, heading) for col, heading in _DEMOGRAPHIC_GROUPS if col in df.columns
+    ]
+
     # Calculate average grammar rating
-    df["avg_grammar"] = df[grammar_cols].mean(axis=1)
+    df = df.assign(
+        avg_grammar=_nanmean_rows(ratings),
+        **{col: df[col].astype("category") for col, _ in groups},
+    )
 
     results = {}
 
-    # Analyze by age
-    if "age" in df.columns:
-        age_analysis = (
-            df.groupby("age")["avg_grammar"].agg(["mean", "std", "count"]).round(3)
-        )
-        results["age"] = age_analysis
-        print(f"\n📈 By Age Group:")
-        print(age_analysis)
-
-    # Analyze by gender
-    if "gender" in df.columns:
-        gender_analysis = (
-            df.groupby("gender")["avg_grammar"].agg(["mean", "std", "count"]).round(3)
-        )
-        results["gender"] = gender_analysis
-        print(f"\n👥 By Gender:")
-        print(gender_analysis)
-
-    # Analyze by English proficiency
-    if "english_proficiency" in df.columns:
-        proficiency_analysis = (
-            df.groupby("english_proficiency")["avg_grammar"]
-            .agg(["mean", "std", "count"])
+    # Analyze by age, gender and English proficiency
+    for col, heading in groups:
+        analysis = (
+            df.groupby(col, observed=True)
+            .agg(
+                mean=("avg_grammar", "mean"),
+                std=("avg_grammar", "std"),
+                count=("avg_grammar", "count"),
+            )
             .round(3)
         )
-        results["english_proficiency"] = proficiency_analysis
-        print(f"\n🗣️ By English Proficiency:")
-        print(proficiency_analysis)
+        results[col] = analysis
+        print(f"\n{heading}")
+        print(analysis)
 
     # Export to Excel with multiple sheets
     output_file = "demographic_analysis.xlsx"
-    with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
+    with pd.ExcelWriter(output_file, engine=_EXCEL_ENGINE) as writer:
         for demo_type, demo_df in results.items():
             demo_df.to_excel(writer, sheet_name=demo_type)
 
@@ -617,7 +1070,9 @@ def analyze_by_demographics(csv_file="results_analysis.csv"):
     return results
 
 
-def check_incomplete_responses(csv_file="results_analysis.csv"):
+def check_incomplete_responses(
+    csv_file="results_analysis.csv", df=None, cols=None, ratings=None
+):
     """
     Check for incomplete responses (missing ratings).
 
@@ -626,17 +1081,17 @@ def check_incomplete_responses(csv_file="results_analysis.csv"):
     """
     print("\n🔍 Checking for Incomplete Responses...")
 
-    df = pd.read_csv(csv_file)
-
-    # Get all grammar rating columns
-    grammar_cols = [col for col in df.columns if col.startswith("grammar-item")]
+    df, grammar_cols, _, ratings = _load(csv_file, df, cols, ratings)
 
     if not grammar_cols:
         print("❌ No grammar rating columns found!")
         return None
 
+    if ratings is None:
+        ratings = _ratings_block(df, grammar_cols)
+
     # Count missing ratings per participant
-    df["missing_count"] = df[grammar_cols].isna().sum(axis=1)
+    df = df.assign(missing_count=np.isnan(ratings).sum(axis=1))
 
     # Filter incomplete responses
     incomplete = df[df["missing_count"] > 0][
@@ -666,7 +1121,9 @@ def check_incomplete_responses(csv_file="results_analysis.csv"):
     return incomplete
 
 
-def check_suspicious_patterns(csv_file="results_analysis.csv"):
+def check_suspicious_patterns(
+    csv_file="results_analysis.csv", df=None, cols=None, ratings=None
+):
     """
     Check for suspicious response patterns (e.g., all same rating, straight-lining).
 
@@ -675,51 +1132,60 @@ def check_suspicious_patterns(csv_file="results_analysis.csv"):
     """
     print("\n🚨 Checking for Suspicious Response Patterns...")
 
-    df = pd.read_csv(csv_file)
-
-    # Get all grammar rating columns
-    grammar_cols = [col for col in df.columns if col.startswith("grammar-item")]
+    df, grammar_cols, _, ratings = _load(csv_file, df, cols, ratings)
 
     if not grammar_cols:
         print("❌ No grammar rating columns found!")
         return None
 
-    suspicious_data = []
+    if ratings is None:
+        ratings = _ratings_block(df, grammar_cols)
 
-    for idx, row in df.iterrows():
-        ratings = row[grammar_cols].dropna()
+    answered = (~np.isnan(ratings)).sum(axis=1)
 
-        if len(ratings) == 0:
-            continue
+    # Sorted rows (NaN last) give distinct values and the mode in one pass;
+    # on ties the smallest rating wins, as with Series.mode()
+    sorted_ratings = np.sort(ratings, axis=1)
+    valid = ~np.isnan(sorted_ratings)
+    run_start = valid.copy()
+    run_start[:, 1:] &= sorted_ratings[:, 1:] != sorted_ratings[:, :-1]
+    unique_values = run_start.sum(axis=1)
 
-        # Check for all same rating (straight-lining)
-        all_same = ratings.nunique() == 1
-
-        # Check for very low variance
-        low_variance = ratings.std() < 0.5 if len(ratings) > 1 else False
-
-        # Check for response time if available (placeholder)
-
-        if all_same or low_variance:
-            suspicious_data.append(
-                {
-                    "prolific_id": row["prolific_id"],
-                    "task_number": row["task_number"],
-                    "all_same": all_same,
-                    "low_variance": low_variance,
-                    "std": ratings.std(),
-                    "unique_values": ratings.nunique(),
-                    "most_common_rating": ratings.mode()[0]
-                    if len(ratings) > 0
-                    else None,
-                }
-            )
+    positions = np.arange(sorted_ratings.shape[1])
+    start_index = np.maximum.accumulate(np.where(run_start, positions, 0), axis=1)
+    run_length = np.where(valid, positions - start_index + 1, 0)
+    most_common = sorted_ratings[
+        np.arange(len(sorted_ratings)), run_length.argmax(axis=1)
+    ]
+
+    with warnings.catch_warnings():
+        # Single-rating rows have an undefined (NaN) sample std
+        warnings.simplefilter("ignore", RuntimeWarning)
+        stds = np.nanstd(ratings, axis=1, ddof=1)
 
-    if not suspicious_data:
+    # Check for all same rating (straight-lining) and very low variance
+    all_same = unique_values == 1
+    low_variance = (answered > 1) & (stds < 0.5)
+
+    # Check for response time if available (placeholder)
+
+    suspicious = (answered > 0) & (all_same | low_variance)
+
+    if not suspicious.any():
         print("✅ No suspicious patterns detected!")
         return pd.DataFrame()
 
-    suspicious_df = pd.DataFrame(suspicious_data)
+    suspicious_df = pd.DataFrame(
+        {
+            "prolific_id": df["prolific_id"].to_numpy()[suspicious],
+            "task_number": df["task_number"].to_numpy()[suspicious],
+            "all_same": all_same[suspicious],
+            "low_variance": low_variance[suspicious],
+            "std": stds[suspicious],
+            "unique_values": unique_values[suspicious],
+            "most_common_rating": most_common[suspicious],
+        }
+    )
 
     print(f"⚠️  Found {len(suspicious_df)} suspicious responses")
     print(f"\n   Straight-lining (all same): {suspicious_df['all_same'].sum()}")
@@ -737,13 +1203,69 @@ def check_suspicious_patterns(csv_file="results_analysis.csv"):
     return suspicious_df
 
 
-def calculate_fleiss_kappa(csv_file="aggregated_results.csv", max_items=None):
+def _rating_codes(column):
+    """
+    Packs an aggregated "_all" column into an int8 matrix (one row per task,
+    -1 for padding), skipping tasks with any rating that is not a number.
+    """
+    tokens = column.dropna().astype(str).str.split(", ", expand=True)
+    values = tokens.apply(pd.to_numeric, errors="coerce")
+    parsed = ~(values.isna() & tokens.notna()).any(axis=1)
+    codes = np.trunc(values[parsed].to_numpy(dtype=np.float64))
+    codes = np.clip(np.nan_to_num(codes, nan=-1), -1, 8)
+    return codes.astype(np.int8)
+
+
+def _list_codes(lists):
+    """
+    _rating_codes() for a list<double> ratings array: skips tasks without
+    ratings or with a null (missing) one.
+    """
+    rows, positions, width = _list_rows(lists)
+    flat = lists.flatten()
+    has_null = np.zeros(len(lists), bool)
+    has_null[rows[flat.is_null().to_numpy(zero_copy_only=False)]] = True
+    codes = np.full((len(lists), width), -1.0)
+    codes[rows, positions] = flat.to_numpy(zero_copy_only=False)
+    keep = lists.is_valid().to_numpy(zero_copy_only=False) & ~has_null
+    codes = np.clip(np.nan_to_num(np.trunc(codes[keep]), nan=-1), -1, 8)
+    return codes.astype(np.int8)
+
+
+def _rating_histogram_loop(rows):
+    out = np.zeros((rows.shape[0], 7), np.int32)
+    for i in range(rows.shape[0]):
+        for j in range(rows.shape[1]):
+            v = rows[i, j]
+            if 1 <= v <= 7:
+                out[i, v - 1] += 1
+    return out
+
+
+if njit is not None:
+    _rating_histogram = njit(cache=True)(_rating_histogram_loop)
+else:
+
+    def _rating_histogram(rows):
+        """(tasks, 7) counts of each rating 1-7, for fleiss_kappa()."""
+        return (rows[:, :, None] == np.arange(1, 8, dtype=np.int8)).sum(
+            axis=1, dtype=np.int32
+        )
+
+
+def calculate_fleiss_kappa(
+    csv_file="aggregated_results.csv", max_items=None, df=None, cols=None, ratings=None
+):
     """
     Calculate Fleiss' Kappa for inter-annotator agreement.
 
     Args:
         csv_file: Path to aggregated results CSV
         max_items: Maximum number of items to analyze (None for all)
+        df: Already loaded aggregated DataFrame (read from csv_file if omitted)
+        cols: Aggregated "_all" rating columns of df (detected if omitted)
+        ratings: {column: list<double> array} of those ratings (the strings
+            are parsed if omitted)
 
     Returns:
         DataFrame with Fleiss' Kappa for each item
@@ -756,49 +1278,29 @@ def calculate_fleiss_kappa(csv_file="aggregated_results.csv", max_items=None):
         print("❌ statsmodels not installed. Install with: pip install statsmodels")
         return None
 
-    # Load aggregated results
-    agg_df = pd.read_csv(csv_file)
+    # Load aggregated results and all grammar item columns
+    agg_df, _, grammar_cols, rating_lists = _load(csv_file, df, cols, ratings)
 
     kappa_results = []
 
-    # Get all grammar item columns
-    grammar_cols = [
-        col
-        for col in agg_df.columns
-        if col.startswith("grammar-item") and col.endswith("_all")
-    ]
-
     if max_items:
         grammar_cols = grammar_cols[:max_items]
 
     for col in grammar_cols:
         item_name = col.replace("_all", "")
 
-        # Convert ratings to matrix format
-        ratings_matrix = []
-        valid_tasks = 0
-
-        for ratings_str in agg_df[col].dropna():
-            try:
-                ratings = [int(float(x)) for x in str(ratings_str).split(", ")]
-                # Count occurrences of each rating (1-7)
-                counts = [ratings.count(i) for i in range(1, 8)]
-                ratings_matrix.append(counts)
-                valid_tasks += 1
-            except (ValueError, AttributeError):
-                continue
+        # Count occurrences of each rating (1-7) per task
+        if rating_lists is not None and col in rating_lists:
+            codes = _list_codes(rating_lists[col])
+        else:
+            codes = _rating_codes(agg_df[col])
+        ratings_matrix = _rating_histogram(codes)
+        valid_tasks = len(ratings_matrix)
 
         if len(ratings_matrix) > 0:
             try:
                 kappa = fleiss_kappa(ratings_matrix, method="fleiss")
-                kappa_results.append(
-                    {
-                        "item": item_name,
-                        "fleiss_kappa": round(kappa, 4),
-                        "num_tasks": valid_tasks,
-                        "interpretation": interpret_kappa(kappa),
-                    }
-                )
+                kappa_results.append((item_name, kappa, valid_tasks))
             except Exception as e:
                 print(f"   ⚠️  Error calculating kappa for {item_name}: {e}")
 
@@ -806,7 +1308,16 @@ def calculate_fleiss_kappa(csv_file="aggregated_results.csv", max_items=None):
         print("❌ No valid kappa calculations!")
         return None
 
-    kappa_df = pd.DataFrame(kappa_results)
+    items, kappas, num_tasks = zip(*kappa_results)
+    kappas = np.array(kappas, dtype=np.float64)
+    kappa_df = pd.DataFrame(
+        {
+            "item": items,
+            "fleiss_kappa": kappas.round(4),
+            "num_tasks": num_tasks,
+            "interpretation": interpret_kappas(kappas),
+        }
+    )
 
     print(f"✅ Calculated Fleiss' Kappa for {len(kappa_df)} items")
     print(f"\n{kappa_df.to_string(index=False)}")
@@ -819,53 +1330,90 @@ def calculate_fleiss_kappa(csv_file="aggregated_results.csv", max_items=None):
     return kappa_df
 
 
+# Lower bounds of each Fleiss' Kappa band after "Poor" (kappa < 0)
+_KAPPA_BINS = np.array([0.0, 0.20, 0.40, 0.60, 0.80])
+_KAPPA_LABELS = np.array(
+    ["Poor", "Slight", "Fair", "Moderate", "Substantial", "Almost Perfect"],
+    dtype=object,
+)
+
+
+def interpret_kappas(kappas):
+    """Interpret an array of Fleiss' Kappa values in one lookup"""
+    return _KAPPA_LABELS[np.searchsorted(_KAPPA_BINS, np.asarray(kappas), side="right")]
+
+
 def interpret_kappa(kappa):
     """Interpret Fleiss' Kappa value"""
-    if kappa < 0:
-        return "Poor"
-    elif kappa < 0.20:
-        return "Slight"
-    elif kappa < 0.40:
-        return "Fair"
-    elif kappa < 0.60:
-        return "Moderate"
-    elif kappa < 0.80:
-        return "Substantial"
-    else:
-        return "Almost Perfect"
-
-
-def export_to_excel_comprehensive(output_file="comprehensive_results.xlsx"):
+    return interpret_kappas(kappa)
+
+
+def _run_report_analyses():
+    """
+    Regenerates both CSV exports and runs every analysis that has a sheet in
+    the comprehensive report. Returns the frames keyed by report name.
+    """
+    # First, generate all the CSV files (fetching the results only once)
+    results_df = get_all_results_df()
+    all_results = results_df.to_dict("records") if results_df is not None else None
+    export_to_csv("results_analysis.csv", results_df=results_df)
+    export_aggregated_by_task("aggregated_results.csv", all_results=all_results)
+
+    # Read each export once and share it (and its columns) across the analyses
+    results, grammar_cols, _, ratings = _load("results_analysis.csv")
+    aggregated, _, grammar_all_cols, rating_lists = _load("aggregated_results.csv")
+    shared = {"df": results, "cols": grammar_cols, "ratings": ratings}
+
+    return {
+        "results": results,
+        "aggregated": aggregated,
+        "avg_ratings": calculate_average_ratings_per_task(
+            df=results, cols=grammar_cols
+        ),
+        "agreement": analyze_inter_annotator_agreement(
+            df=aggregated, cols=grammar_all_cols, ratings=rating_lists
+        ),
+        "problematic": identify_problematic_tasks(**shared),
+        "demographics": analyze_by_demographics(**shared),
+        "incomplete": check_incomplete_responses(**shared),
+        "suspicious": check_suspicious_patterns(**shared),
+    }
+
+
+def export_to_excel_comprehensive(
+    output_file="comprehensive_results.xlsx", reports=None
+):
     """
     Export all results to a comprehensive Excel file with multiple sheets.
 
+    Args:
+        output_file: Path of the Excel file to write
+        reports: Frames already computed by the caller, keyed as in
+            _run_report_analyses(); regenerated from the database if omitted
+
     Returns:
         Path to the created Excel file
     """
     print("\n📊 Creating Comprehensive Excel Report...")
 
     try:
-        # First, generate all the CSV files
-        detailed_df = export_to_csv("results_analysis.csv")
-        aggregated_df = export_aggregated_by_task("aggregated_results.csv")
-
-        # Run all analyses
-        avg_ratings = calculate_average_ratings_per_task("results_analysis.csv")
-        agreement = analyze_inter_annotator_agreement("aggregated_results.csv")
-        problematic = identify_problematic_tasks("results_analysis.csv")
-        demographics = analyze_by_demographics("results_analysis.csv")
-        incomplete = check_incomplete_responses("results_analysis.csv")
-        suspicious = check_suspicious_patterns("results_analysis.csv")
+        if reports is None:
+            reports = _run_report_analyses()
+
+        results = reports["results"]
+        aggregated = reports["aggregated"]
+        avg_ratings = reports["avg_ratings"]
+        agreement = reports["agreement"]
+        problematic = reports["problematic"]
+        demographics = reports["demographics"]
+        incomplete = reports["incomplete"]
+        suspicious = reports["suspicious"]
 
         # Create Excel writer
-        with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
+        with pd.ExcelWriter(output_file, engine=_EXCEL_ENGINE) as writer:
             # Main data sheets
-            pd.read_csv("results_analysis.csv").to_excel(
-                writer, sheet_name="Detailed_Results", index=False
-            )
-            pd.read_csv("aggregated_results.csv").to_excel(
-                writer, sheet_name="Aggregated_Results", index=False
-            )
+            results.to_excel(writer, sheet_name="Detailed_Results", index=False)
+            aggregated.to_excel(writer, sheet_name="Aggregated_Results", index=False)
 
             # Analysis sheets
             if avg_ratings is not None:
@@ -904,6 +1452,13 @@ def export_to_excel_comprehensive(output_file="comprehensive_results.xlsx"):
         return None
 
 
+def _run_captured(func, **kwargs):
+    """Runs one analysis in a worker process, returning (result, printed output)."""
+    with io.StringIO() as buffer, redirect_stdout(buffer):
+        result = func(**kwargs)
+        return result, buffer.getvalue()
+
+
 def run_all_analyses():
     """
     Run all analysis functions and generate comprehensive reports.
@@ -918,35 +1473,58 @@ def run_all_analyses():
 
     # Step 2: Export base files
     print("\n[2/9] Exporting detailed results...")
-    export_to_csv("results_analysis.csv")
+    results_df = get_all_results_df()
+    all_results = results_df.to_dict("records") if results_df is not None else None
+    export_to_csv("results_analysis.csv", results_df=results_df)
 
     print("\n[3/9] Exporting aggregated results...")
-    export_aggregated_by_task("aggregated_results.csv")
-
-    # Step 3: Run analyses
-    print("\n[4/9] Calculating average ratings...")
-    calculate_average_ratings_per_task()
-
-    print("\n[5/9] Analyzing inter-annotator agreement...")
-    analyze_inter_annotator_agreement()
-
-    print("\n[6/9] Identifying problematic tasks...")
-    identify_problematic_tasks()
-
-    print("\n[7/9] Analyzing by demographics...")
-    analyze_by_demographics()
-
-    print("\n[8/9] Checking for quality issues...")
-    check_incomplete_responses()
-    check_suspicious_patterns()
-
-    # Step 4: Calculate Fleiss' Kappa
-    print("\n[9/9] Calculating Fleiss' Kappa...")
-    calculate_fleiss_kappa()
+    export_aggregated_by_task("aggregated_results.csv", all_results=all_results)
+
+    # Step 3: Run analyses (each export is read once and shared)
+    results, grammar_cols, _, ratings = _load("results_analysis.csv")
+    aggregated, _, grammar_all_cols, rating_lists = _load("aggregated_results.csv")
+
+    # Report name -> (analysis, keyword arguments sharing the loaded frames)
+    by_result = {"df": results, "cols": grammar_cols}
+    shared = {**by_result, "ratings": ratings}
+    by_task = {"df": aggregated, "cols": grammar_all_cols, "ratings": rating_lists}
+    stages = {
+        "avg_ratings": (calculate_average_ratings_per_task, by_result),
+        "agreement": (analyze_inter_annotator_agreement, by_task),
+        "problematic": (identify_problematic_tasks, shared),
+        "demographics": (analyze_by_demographics, shared),
+        "incomplete": (check_incomplete_responses, shared),
+        "suspicious": (check_suspicious_patterns, shared),
+        # Step 4: Calculate Fleiss' Kappa
+        "kappa": (calculate_fleiss_kappa, by_task),
+    }
+    headings = {
+        "avg_ratings": "[4/9] Calculating average ratings...",
+        "agreement": "[5/9] Analyzing inter-annotator agreement...",
+        "problematic": "[6/9] Identifying problematic tasks...",
+        "demographics": "[7/9] Analyzing by demographics...",
+        "incomplete": "[8/9] Checking for quality issues...",
+        "kappa": "[9/9] Calculating Fleiss' Kappa...",
+    }
+
+    reports = {"results": results, "aggregated": aggregated}
+
+    # The analyses are independent, so they run in parallel worker processes;
+    # each one's output is printed in order once it has finished
+    with ProcessPoolExecutor(max_workers=min(len(stages), os.cpu_count() or 1)) as pool:
+        futures = {
+            name: pool.submit(_run_captured, func, **kwargs)
+            for name, (func, kwargs) in stages.items()
+        }
+        for name, future in futures.items():
+            if name in headings:
+                print(f"\n{headings[name]}")
+            reports[name], output = future.result()
+            print(output, end="")
 
-    # Step 5: Create comprehensive Excel report
+    # Step 5: Create comprehensive Excel report from the frames computed above
     print("\n[Final] Creating comprehensive Excel report...")
-    export_to_excel_comprehensive()
+    export_to_excel_comprehensive(reports=reports)
 
     print("\n" + "=" * 80)
     print("✅ ANALYSIS COMPLETE!")
@@ -107,35 +107,40 @@ NUMBER_OF_TASKS = len(df)  # Number of tasks to create in the database
 
 import sqlite3
 import psycopg2
+from psycopg2.extras import execute_values
 import os
+import sys
 import time
-from uuid import uuid4
+from uuid import UUID
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# PostgreSQL (Supabase) connection parameters, read once at import
+PG_CREDS = {
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT"),
+    "dbname": os.getenv("DB_NAME"),
+}
+USE_PG = all(PG_CREDS.values())
+
+# Puts allocations older than {cutoff} back to waiting; shared by
+# DataManager.expire_tasks and the pg_cron job from scheduleExpiry()
+EXPIRE_TASKS_SQL = (
+    "UPDATE tasks SET status='waiting', prolific_id = NULL, time_allocated = NULL, session_id = NULL "
+    "WHERE status='allocated' AND time_allocated < {cutoff}"
+)
+
 
 def create_connection(db_file="database.db"):
     """create a database connection to PostgreSQL (Supabase) or SQLite"""
-    # Fixed connection parameters
-    USER = os.getenv("DB_USER")
-    PASSWORD = os.getenv("DB_PASSWORD")
-    HOST = os.getenv("DB_HOST")
-    PORT = os.getenv("DB_PORT")
-    DBNAME = os.getenv("DB_NAME")
-
-    if USER and PASSWORD and HOST and PORT and DBNAME:
+    if USE_PG:
         # Use Supabase PostgreSQL with retry logic
         for attempt in range(3):
             try:
-                conn = psycopg2.connect(
-                    user=USER,
-                    password=PASSWORD,
-                    host=HOST,
-                    port=PORT,
-                    dbname=DBNAME,
-                    connect_timeout=10,
-                )
+                conn = psycopg2.connect(**PG_CREDS, connect_timeout=10)
                 # Test the connection
                 cursor = conn.cursor()
                 cursor.execute("SELECT 1")
@@ -155,9 +160,10 @@ def create_connection(db_file="database.db"):
         return sqlite3.connect(db_file)
 
 
-# Creates the DB file if it doesn't exist, and creates the tables if they don't exist.
-def initDatabase():
-    conn = create_connection()
+def initDatabase(conn=None):
+    owns_conn = conn is None
+    if owns_conn:
+        conn = create_connection()
     cursor = conn.cursor()
     is_postgres = hasattr(conn, "server_version")
 
@@ -222,59 +228,204 @@ CREATE TABLE IF NOT EXISTS consent (
 """
         print("Creating SQLite tables...")
 
+    # Indexes for DataManager's per-request lookups. The partial index covers
+    # just the allocated rows that expire_tasks scans.
+    include = " INCLUDE (id, task_number)" if is_postgres else ""
+    create_indexes = [
+        f"CREATE INDEX IF NOT EXISTS idx_tasks_prolific_status ON tasks (prolific_id, status){include};",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_tasknum_status ON tasks (task_number, status);",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_time ON tasks (status, time_allocated) WHERE status = 'allocated';",
+    ]
+
     cursor.execute(create_tasks_table)
     cursor.execute(create_results_table)
     cursor.execute(create_consent_table)
+    for create_index in create_indexes:
+        cursor.execute(create_index)
 
     conn.commit()
-    conn.close()
+    migrateConsent(conn=conn)
+    if owns_conn:
+        conn.close()
     print("Database tables created successfully!")
 
 
-def initTasks(num_tasks):
+def migrateConsent(conn=None):
+    """
+    Keeps only the latest consent row per participant/session and creates the
+    uq_consent_participant unique index, the conflict target of
+    DataManager.store_consent's upsert. Safe to re-run on a live database
+    (python CreateDatabase.py migrate).
+
+    :param conn: An open connection to reuse; one is created and closed if omitted.
+    """
+    owns_conn = conn is None
+    if owns_conn:
+        conn = create_connection()
+    cursor = conn.cursor()
+
+    # No consent can be stored between the clean-up and the index
+    if hasattr(conn, "server_version"):
+        cursor.execute("LOCK TABLE consent IN SHARE ROW EXCLUSIVE MODE;")
+    else:
+        cursor.execute("BEGIN IMMEDIATE")
+
+    cursor.execute(
+        """
+DELETE FROM consent WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY prolific_id, session_id
+            ORDER BY consent_timestamp DESC NULLS LAST, id DESC
+        ) AS rn
+        FROM consent
+        WHERE prolific_id IS NOT NULL AND session_id IS NOT NULL
+    ) ranked
+    WHERE rn > 1
+);
+"""
+    )
+    removed = cursor.rowcount
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_consent_participant ON consent (prolific_id, session_id);"
+    )
+
+    conn.commit()
+    if owns_conn:
+        conn.close()
+    print(f"Removed {removed} duplicate consent rows; uq_consent_participant is in place.")
+
+
+def initTasks(num_tasks, conn=None):
     """
     Initializes a specified number of tasks in the 'tasks' table with default values.
     Each task will have multiple entries (as defined by COMPLETIONS_PER_TASK) with unique IDs but the same task number.
 
     :param num_tasks: The number of tasks to initialize.
+    :param conn: An open connection to reuse; one is created and closed if omitted.
     """
     # Connect to the database
-    conn = create_connection()
+    owns_conn = conn is None
+    if owns_conn:
+        conn = create_connection()
     cursor = conn.cursor()
 
     # Check if we're using PostgreSQL or SQLite
     is_postgres = hasattr(conn, "server_version")
-    placeholder = "%s" if is_postgres else "?"
 
     # Default status for new tasks
     default_status = "waiting"
 
-    # Prepare the SQL query for inserting a new task
-    insert_task_query = f"""
+    print(f"Initializing {num_tasks * COMPLETIONS_PER_TASK} task entries...")
+
+    # One row per task entry (COMPLETIONS_PER_TASK per task), each with a unique
+    # random (version 4) ID sliced from a single read of OS entropy
+    total = num_tasks * COMPLETIONS_PER_TASK
+    entropy = os.urandom(16 * total)
+    rows = [
+        (
+            str(UUID(bytes=entropy[16 * i : 16 * (i + 1)], version=4)),
+            i // COMPLETIONS_PER_TASK + 1,
+            default_status,
+        )
+        for i in range(total)
+    ]
+
+    # Insert all rows in a single transaction, in as few statements as possible
+    if is_postgres:
+        insert_task_query = """
     INSERT INTO tasks (id, task_number, prolific_id, time_allocated, session_id, status)
-    VALUES ({placeholder}, {placeholder}, NULL, NULL, NULL, {placeholder});
+    VALUES %s;
     """
+        execute_values(
+            cursor,
+            insert_task_query,
+            rows,
+            template="(%s, %s, NULL, NULL, NULL, %s)",
+            page_size=1000,
+        )
+    else:
+        insert_task_query = """
+    INSERT INTO tasks (id, task_number, prolific_id, time_allocated, session_id, status)
+    VALUES (?, ?, NULL, NULL, NULL, ?);
+    """
+        # Setup is re-runnable, so skip journaling and fsyncs for the bulk load;
+        # the connection's own settings are put back afterwards
+        saved_pragmas = {
+            pragma: cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in ("journal_mode", "synchronous", "temp_store", "cache_size")
+        }
+        cursor.executescript(
+            "PRAGMA synchronous=OFF; PRAGMA journal_mode=MEMORY;"
+            " PRAGMA temp_store=MEMORY; PRAGMA cache_size=-200000;"
+        )
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.executemany(insert_task_query, rows)
+
+    # Commit the changes and close the connection if we opened it
+    conn.commit()
+    if not is_postgres:
+        # Back to the journal mode and durability the database had before loading
+        cursor.executescript(
+            "".join(f"PRAGMA {pragma}={value};" for pragma, value in saved_pragmas.items())
+        )
+    if owns_conn:
+        conn.close()
+    print(f"Successfully created {num_tasks * COMPLETIONS_PER_TASK} task entries!")
 
-    print(f"Initializing {num_tasks * COMPLETIONS_PER_TASK} task entries...")
 
-    # Insert the specified number of tasks, repeated according to COMPLETIONS_PER_TASK
-    for task_number in range(1, num_tasks + 1):
-        for _ in range(COMPLETIONS_PER_TASK):
-            # Generate a unique ID for the task
-            task_id = str(uuid4())
-            # Execute the SQL query
-            cursor.execute(insert_task_query, (task_id, task_number, default_status))
+def scheduleExpiry(time_limit=3600, conn=None):
+    """
+    Registers a pg_cron job that puts tasks allocated for longer than time_limit
+    seconds back to waiting every five minutes, so expiry runs once in the
+    database instead of in every web worker. PostgreSQL only.
 
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
-    print(f"Successfully created {num_tasks * COMPLETIONS_PER_TASK} task entries!")
+    :param time_limit: Seconds an allocation may stay open (main.MAX_TIME).
+    :param conn: An open connection to reuse; one is created and closed if omitted.
+    :return: True if the job was scheduled.
+    """
+    owns_conn = conn is None
+    if owns_conn:
+        conn = create_connection()
+    if not hasattr(conn, "server_version"):
+        print("pg_cron needs PostgreSQL; run 'python DataManager.py' to expire tasks instead.")
+        if owns_conn:
+            conn.close()
+        return False
+
+    # time_allocated is stored in UTC (datetime.utcnow() in allocate_task)
+    expire_sql = EXPIRE_TASKS_SQL.format(
+        cutoff=f"(now() AT TIME ZONE 'UTC') - interval '{int(time_limit)} seconds'"
+    )
+    cursor = conn.cursor()
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_cron;")
+        # Scheduling under an existing job name replaces that job
+        cursor.execute(
+            "SELECT cron.schedule('expire_tasks', '*/5 * * * *', %s);", (expire_sql,)
+        )
+        conn.commit()
+        print("Scheduled the expire_tasks pg_cron job.")
+        return True
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Could not schedule pg_cron job, run 'python DataManager.py' to expire tasks instead: {e}")
+        return False
+    finally:
+        if owns_conn:
+            conn.close()
 
 
 # --------------------------------------------------
 
-if __name__ == "__main__":
+if __name__ == "__main__" and sys.argv[1:] == ["migrate"]:
+    # Existing databases: bring the schema up to date without touching the tasks
+    migrateConsent()
+elif __name__ == "__main__":
     print("Starting database initialization...")
-    initDatabase()
-    initTasks(NUMBER_OF_TASKS)
+    conn = create_connection()
+    initDatabase(conn=conn)
+    initTasks(NUMBER_OF_TASKS, conn=conn)
+    scheduleExpiry(conn=conn)
+    conn.close()
     print("Database initialization complete!")
\ No newline at end of file
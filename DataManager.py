@@ -1,46 +1,243 @@
 import sqlite3
 import psycopg2
+import psycopg2.errors
+import psycopg2.pool
 import os
-from datetime import datetime
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from uuid import uuid4
-from CreateDatabase import COMPLETIONS_PER_TASK
+from CreateDatabase import COMPLETIONS_PER_TASK, EXPIRE_TASKS_SQL, PG_CREDS, USE_PG
 from dotenv import load_dotenv
 
 load_dotenv()
 # TODO: Race conditions should be investigated - handled by using transactions and locking
 # TODO: What happens when a worker returns results that have not been allocated to them?
 
+# Process-wide PostgreSQL (Supabase) connection pool, created on first use so
+# that every forked worker opens its own connections. Size DB_POOL_MAXCONN to
+# the number of request threads per worker.
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_POOL_MINCONN = 2
+_POOL_MAXCONN = int(os.getenv("DB_POOL_MAXCONN", "16"))
+_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+# Threads beyond _POOL_MAXCONN wait here for a connection instead of failing
+_POOL_SLOTS = threading.BoundedSemaphore(_POOL_MAXCONN)
+
+# Run the hot queries as server-side prepared statements, so PostgreSQL parses
+# and plans them once per connection. Opt-in: Supabase's transaction-mode
+# pooler (port 6543) does not keep prepared statements between transactions.
+_USE_PREPARED = os.getenv("DB_PREPARED_STATEMENTS", "").lower() in ("1", "true", "yes")
+# Statement names prepared on each pooled connection
+_PREPARED = weakref.WeakKeyDictionary()
+
+# SQLite fallback: one shared connection, used by one thread at a time
+_SQLITE_CONN = None
+_SQLITE_DBCONN = None
+_SQLITE_LOCK = threading.Lock()
+
+
+class DBConn:
+    """
+    A borrowed connection and its dialect. get_conn() resolves the dialect
+    once, so queries need not probe the connection to pick their SQL.
+    """
 
-def create_connection(db_file="database.db"):
-    """create a database connection to PostgreSQL (Supabase) or SQLite"""
-    # Check if we have Supabase credentials in environment variables
-    # supabase_host = os.getenv("DB_HOST")
-    # supabase_password = os.getenv("DB_PASSWORD")
-
-    # replace above with below to use env variables
-    USER = os.getenv("DB_USER")
-    PASSWORD = os.getenv("DB_PASSWORD")
-    HOST = os.getenv("DB_HOST")
-    PORT = os.getenv("DB_PORT")
-    DBNAME = os.getenv("DB_NAME")
-    if USER and PASSWORD and HOST and PORT and DBNAME:
-        # Use Supabase PostgreSQL
-        try:
-            conn = psycopg2.connect(
-                user=USER,
-                password=PASSWORD,
-                host=HOST,
-                port=PORT,
-                dbname=DBNAME
+    __slots__ = ("raw", "is_postgres", "sql")
+
+    def __init__(self, raw, is_postgres):
+        self.raw = raw
+        self.is_postgres = is_postgres
+        self.sql = _PG_SQL if is_postgres else _SQLITE_SQL
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+
+def _get_pool():
+    """The PostgreSQL pool, or None when running on SQLite."""
+    global _POOL
+    if not USE_PG:
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            try:
+                _POOL = psycopg2.pool.ThreadedConnectionPool(
+                    _POOL_MINCONN, _POOL_MAXCONN, **PG_CREDS
+                )
+            except psycopg2.Error as e:
+                print(f"PostgreSQL connection failed, falling back to SQLite: {e}")
+                return None
+    return _POOL
+
+
+@contextmanager
+def get_conn(db_file="database.db"):
+    """
+    Borrow a database connection for one unit of work: PostgreSQL (Supabase)
+    from the pool, or the shared SQLite connection for local development.
+    Anything left uncommitted is rolled back when the block exits.
+    """
+    global _SQLITE_CONN, _SQLITE_DBCONN
+
+    pool = _get_pool()
+    if pool is not None:
+        if not _POOL_SLOTS.acquire(timeout=_POOL_TIMEOUT):
+            raise psycopg2.pool.PoolError(
+                f"No database connection became free within {_POOL_TIMEOUT}s"
             )
-            return conn
-        except psycopg2.Error as e:
-            print(f"PostgreSQL connection failed, falling back to SQLite: {e}")
-            # Fall back to SQLite
-            return sqlite3.connect(db_file)
+        try:
+            conn = pool.getconn()
+            try:
+                yield DBConn(conn, True)
+            finally:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                # Broken connections are dropped instead of being handed out again
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            _POOL_SLOTS.release()
+        return
+
+    with _SQLITE_LOCK:
+        if _SQLITE_CONN is None:
+            _SQLITE_CONN = sqlite3.connect(db_file, check_same_thread=False)
+            _SQLITE_DBCONN = DBConn(_SQLITE_CONN, False)
+        try:
+            yield _SQLITE_DBCONN
+        finally:
+            _SQLITE_CONN.rollback()
+
+
+# Columns returned by get_all_tasks, in order
+TASK_COLUMNS = ("id", "task_number", "status", "prolific_id", "time_allocated")
+
+
+def _statements(placeholder):
+    """The DataManager SQL with the given parameter placeholder filled in."""
+    p = placeholder
+    # First waiting task whose task_number this participant has not completed
+    # and that is below the completion cap (COMPLETIONS_PER_TASK)
+    candidate = f"""
+                SELECT c.id FROM tasks c
+                WHERE c.status='waiting'
+                AND c.prolific_id IS NULL
+                AND c.task_number NOT IN (
+                    SELECT task_number FROM tasks WHERE prolific_id={p} AND status='completed'
+                )
+                AND (
+                    SELECT COUNT(*) FROM tasks t2
+                    WHERE t2.task_number=c.task_number
+                    AND t2.status IN ('completed', 'allocated')
+                ) < {COMPLETIONS_PER_TASK}
+                ORDER BY c.task_number
+                LIMIT 1
+                """
+    return {
+        "candidate": candidate,
+        "alloc_participant_check": f"SELECT id, task_number FROM tasks WHERE prolific_id={p} AND status!='completed'",
+        "expire_update": EXPIRE_TASKS_SQL.format(cutoff=p),
+        "get_all_tasks": f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks ORDER BY id LIMIT {p} OFFSET {p}",
+        "get_result": f"SELECT * FROM results WHERE id={p}",
+        # ORDER BY only matters on databases not yet migrated to one row per session
+        "check_consent_select": f"SELECT consent_given FROM consent WHERE prolific_id={p} AND session_id={p} ORDER BY consent_timestamp DESC LIMIT 1",
+    }
+
+
+# One consent row per participant/session (uq_consent_participant): storing
+# consent again updates that row and returns its id
+_CONSENT_UPSERT = (
+    "ON CONFLICT (prolific_id, session_id) DO UPDATE SET consent_given = excluded.consent_given, "
+    "consent_timestamp = excluded.consent_timestamp, ip_address = excluded.ip_address RETURNING id"
+)
+
+# Every statement is built once per dialect here rather than on each call
+_PG_SQL = _statements("%s")
+_PG_SQL.update(
+    {
+        # SKIP LOCKED: concurrent allocators never wait on the same row
+        "alloc_update": f"""
+                    WITH candidate AS ({_PG_SQL["candidate"]} FOR UPDATE SKIP LOCKED)
+                    UPDATE tasks 
+                    SET status='allocated', 
+                        prolific_id=%s, 
+                        time_allocated=%s, 
+                        session_id=%s 
+                    FROM candidate 
+                    WHERE tasks.id=candidate.id
+                    RETURNING tasks.id, tasks.task_number
+                    """,
+        "store_consent_insert": f"INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP, %s) {_CONSENT_UPSERT}",
+        "store_consent_insert_plain": "INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP, %s)",
+        # Complete the participant's task and record the result in one round trip
+        "complete_task": """
+                    WITH upd AS (
+                        UPDATE tasks SET status='completed'
+                        WHERE id=%s AND prolific_id=%s
+                        RETURNING id
+                    )
+                    INSERT INTO results (id, json_string, prolific_id)
+                    SELECT id, %s, %s FROM upd
+                    RETURNING id
+                    """,
+    }
+)
+
+_SQLITE_SQL = _statements("?")
+_SQLITE_SQL.update(
+    {
+        "alloc_update": f"""
+                    UPDATE tasks 
+                    SET status='allocated', 
+                        prolific_id=?, 
+                        time_allocated=?, 
+                        session_id=? 
+                    WHERE id=({_SQLITE_SQL["candidate"]})
+                    RETURNING id, task_number
+                    """,
+        "store_consent_insert": f"INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES (?, ?, ?, ?, ?, ?) {_CONSENT_UPSERT}",
+        "store_consent_insert_plain": "INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES (?, ?, ?, ?, ?, ?)",
+        "complete_task_update": "UPDATE tasks SET status='completed' WHERE id=? AND prolific_id=?",
+        "insert_result": "INSERT INTO results (id, json_string, prolific_id) VALUES (?, ?, ?)",
+    }
+)
+
+
+def _execute(conn, cursor, name, params=()):
+    """
+    Run the statement called name in conn's dialect, through a prepared
+    statement when prepared statements are enabled and conn is PostgreSQL.
+    """
+    sql = conn.sql[name]
+    if not (_USE_PREPARED and conn.is_postgres):
+        cursor.execute(sql, params)
+        return
+
+    prepared = _PREPARED.setdefault(conn.raw, set())
+    if name not in prepared:
+        # PREPARE takes $1, $2, ... where psycopg2 takes %s
+        numbers = iter(range(1, len(params) + 1))
+        cursor.execute(
+            f"PREPARE {name} AS " + re.sub("%s", lambda _: f"${next(numbers)}", sql)
+        )
+        prepared.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
     else:
-        # Use SQLite for local development
-        return sqlite3.connect(db_file)
+        cursor.execute(f"EXECUTE {name}")
 
 
 def allocate_task(prolific_id, session_id):
@@ -48,92 +245,31 @@ def allocate_task(prolific_id, session_id):
     Allocates a task to a participant based on given criteria.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
-            is_postgres = hasattr(conn, "server_version")
+
+            if not conn.is_postgres:
+                # Take the write lock up front so the check and the allocation
+                # below happen as one transaction
+                cursor.execute("BEGIN IMMEDIATE")
 
             # Check if the participant has an incomplete allocated task
-            cursor.execute(
-                f"SELECT id, task_number FROM tasks WHERE prolific_id={placeholder} AND status!='completed'",
-                (prolific_id,),
-            )
+            _execute(conn, cursor, "alloc_participant_check", (prolific_id,))
             allocated_tasks = cursor.fetchall()
             if allocated_tasks:
                 return allocated_tasks[0]
 
-            # Find task_numbers not completed by this participant
-            cursor.execute(
-                f"""
-                SELECT DISTINCT task_number FROM tasks 
-                WHERE task_number NOT IN (
-                    SELECT task_number FROM tasks WHERE prolific_id={placeholder} AND status='completed'
-                )
-                ORDER BY task_number
-                """,
-                (prolific_id,),
-            )
-            available_task_numbers = [row[0] for row in cursor.fetchall()]
-
-            # Try each task_number
-            for task_number in available_task_numbers:
-                # Count completed OR allocated for this task_number
-                cursor.execute(
-                    f"SELECT COUNT(*) FROM tasks WHERE task_number={placeholder} AND status IN ('completed', 'allocated')",
-                    (task_number,),
-                )
-                num_in_progress = cursor.fetchone()[0]
-
-                if num_in_progress < 10:  # COMPLETIONS_PER_TASK = 10
-                    # Lock a specific waiting task row
-                    if is_postgres:
-                        cursor.execute(
-                            f"""
-                            SELECT id FROM tasks 
-                            WHERE task_number={placeholder} 
-                            AND status='waiting' 
-                            AND prolific_id IS NULL
-                            LIMIT 1
-                            FOR UPDATE SKIP LOCKED
-                            """,
-                            (task_number,),
-                        )
-                    else:
-                        cursor.execute(
-                            f"""
-                            SELECT id FROM tasks 
-                            WHERE task_number={placeholder} 
-                            AND status='waiting' 
-                            AND prolific_id IS NULL
-                            LIMIT 1
-                            """,
-                            (task_number,),
-                        )
-
-                    waiting_task = cursor.fetchone()
-
-                    if waiting_task:
-                        task_id = waiting_task[0]
-                        # Update with WHERE conditions to ensure atomicity
-                        cursor.execute(
-                            f"""
-                            UPDATE tasks 
-                            SET status='allocated', 
-                                prolific_id={placeholder}, 
-                                time_allocated={placeholder}, 
-                                session_id={placeholder} 
-                            WHERE id={placeholder} 
-                            AND status='waiting' 
-                            AND prolific_id IS NULL
-                            """,
-                            (prolific_id, datetime.utcnow(), session_id, task_id),
-                        )
-
-                        # Verify the update succeeded (prevents race conditions)
-                        if cursor.rowcount > 0:
-                            conn.commit()
-                            return task_id, task_number
-                        # If rowcount is 0, another process took it, continue to next
+            # Allocate the first candidate task in the same statement that picks it
+            if conn.is_postgres:
+                params = (prolific_id, prolific_id, datetime.utcnow(), session_id)
+            else:
+                params = (prolific_id, datetime.utcnow(), session_id, prolific_id)
+            _execute(conn, cursor, "alloc_update", params)
+
+            allocated = cursor.fetchone()
+            conn.commit()
+            if allocated:
+                return allocated[0], allocated[1]
 
             return None, None
 
@@ -144,43 +280,22 @@ def allocate_task(prolific_id, session_id):
 def expire_tasks(time_limit=3600):
     """
     Expires tasks that have been allocated for longer than a specified time limit.
+    Returns the number of tasks put back to waiting.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
-            current_time = datetime.now()
-
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
-
-            cursor.execute(
-                "SELECT id, time_allocated FROM tasks WHERE status='allocated'"
-            )
-            allocated_tasks = cursor.fetchall()
+            # time_allocated is stored in UTC (datetime.utcnow() in allocate_task)
+            cutoff = datetime.utcnow() - timedelta(seconds=time_limit)
 
-            for task_id, time_allocated in allocated_tasks:
-                print(task_id, time_allocated)
-
-                if time_allocated is None:
-                    print("Uh oh... time_allocated is None")
-                    continue
-
-                # Handle different datetime formats (PostgreSQL vs SQLite)
-                if isinstance(time_allocated, str):
-                    time_diff = (
-                        current_time
-                        - datetime.strptime(time_allocated, "%Y-%m-%d %H:%M:%S.%f")
-                    ).total_seconds()
-                else:
-                    # PostgreSQL returns datetime objects directly
-                    time_diff = (current_time - time_allocated).total_seconds()
-
-                if time_diff > time_limit:
-                    cursor.execute(
-                        f"UPDATE tasks SET status='waiting', prolific_id = NULL, time_allocated = NULL, session_id = NULL WHERE id={placeholder}",
-                        (task_id,),
-                    )
+            # One statement for every stale allocation; tasks without a
+            # time_allocated are never expired
+            _execute(conn, cursor, "expire_update", (cutoff,))
+            expired = cursor.rowcount
+            print(f"Expired {expired} tasks allocated before {cutoff}")
 
             conn.commit()
+            return expired
     except (sqlite3.Error, psycopg2.Error) as e:
         print(f"An error occurred trying to expire tasks: {e}")
 
@@ -190,42 +305,38 @@ def complete_task(id, json_string, prolific_id):
     Completes a task assigned to a participant and records the result.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
 
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
+            if conn.is_postgres:
+                _execute(
+                    conn, cursor, "complete_task", (id, prolific_id, json_string, prolific_id)
+                )
+            else:
+                cursor.execute("BEGIN IMMEDIATE")
+                _execute(conn, cursor, "complete_task_update", (id, prolific_id))
+                if cursor.rowcount > 0:
+                    _execute(conn, cursor, "insert_result", (id, json_string, prolific_id))
 
-            cursor.execute(
-                f"SELECT id FROM tasks WHERE id={placeholder} AND prolific_id={placeholder}",
-                (id, prolific_id),
-            )
-            task = cursor.fetchone()
-            if task is None:
+            # Nothing updated: the task is not allocated to this participant
+            if cursor.rowcount == 0:
                 print("Task not allocated to participant... not completing tasks.")
                 return -1
 
-            cursor.execute(
-                f"UPDATE tasks SET status='completed' WHERE id={placeholder}", (id,)
-            )
-            cursor.execute(
-                f"INSERT INTO results (id, json_string, prolific_id) VALUES ({placeholder}, {placeholder}, {placeholder})",
-                (id, json_string, prolific_id),
-            )
-
             conn.commit()
 
     except (sqlite3.Error, psycopg2.Error) as e:
         print(f"An error occurred trying to complete a task.: {e}")
 
 
-def get_all_tasks():
+def get_all_tasks(limit=100, offset=0):
     """
-    Retrieves all tasks from the tasks table in the database.
+    Retrieves one page of tasks (TASK_COLUMNS, ordered by id) from the tasks table.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM tasks")
+            _execute(conn, cursor, "get_all_tasks", (limit, offset))
             tasks = cursor.fetchall()
             return tasks
     except (sqlite3.Error, psycopg2.Error) as e:
@@ -238,14 +349,10 @@ def get_specific_result(result_id):
     Retrieves a specific result from the results table based on the result ID.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
 
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
-
-            cursor.execute(
-                f"SELECT * FROM results WHERE id={placeholder}", (result_id,)
-            )
+            _execute(conn, cursor, "get_result", (result_id,))
             result = cursor.fetchone()
             return result
     except (sqlite3.Error, psycopg2.Error) as e:
@@ -254,33 +361,37 @@ def get_specific_result(result_id):
 
 def store_consent(prolific_id, session_id, consent_given=True, ip_address=None):
     """
-    Store consent information in the consent table.
+    Store consent information in the consent table, in one statement. Returns
+    the id of the participant/session's consent row.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
-            is_postgres = hasattr(conn, "server_version")
 
             consent_id = str(uuid4())
 
-            if is_postgres:
-                cursor.execute(
-                    f"INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, CURRENT_TIMESTAMP, {placeholder})",
-                    (consent_id, prolific_id, session_id, consent_given, ip_address),
-                )
+            if conn.is_postgres:
+                params = (consent_id, prolific_id, session_id, consent_given, ip_address)
             else:
-                cursor.execute(
-                    f"INSERT INTO consent (id, prolific_id, session_id, consent_given, consent_timestamp, ip_address) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})",
-                    (
-                        consent_id,
-                        prolific_id,
-                        session_id,
-                        consent_given,
-                        datetime.utcnow().isoformat(),
-                        ip_address,
-                    ),
+                params = (
+                    consent_id,
+                    prolific_id,
+                    session_id,
+                    consent_given,
+                    datetime.utcnow().isoformat(),
+                    ip_address,
                 )
+            try:
+                _execute(conn, cursor, "store_consent_insert", params)
+                consent_id = cursor.fetchone()[0]
+            except (sqlite3.OperationalError, psycopg2.errors.InvalidColumnReference) as e:
+                if not conn.is_postgres and "ON CONFLICT" not in str(e):
+                    raise
+                # uq_consent_participant is not there yet (python CreateDatabase.py
+                # migrate): store a new row, as before the upsert
+                conn.rollback()
+                cursor = conn.cursor()
+                _execute(conn, cursor, "store_consent_insert_plain", params)
 
             conn.commit()
             return consent_id
@@ -295,14 +406,10 @@ def check_consent(prolific_id, session_id):
     Check if consent has already been given for this participant/session.
     """
     try:
-        with create_connection() as conn:
+        with get_conn() as conn:
             cursor = conn.cursor()
-            placeholder = "%s" if hasattr(conn, "server_version") else "?"
 
-            cursor.execute(
-                f"SELECT consent_given FROM consent WHERE prolific_id={placeholder} AND session_id={placeholder} ORDER BY consent_timestamp DESC LIMIT 1",
-                (prolific_id, session_id),
-            )
+            _execute(conn, cursor, "check_consent_select", (prolific_id, session_id))
             result = cursor.fetchone()
 
             return result[0] if result else False
@@ -311,6 +418,13 @@ def check_consent(prolific_id, session_id):
         print(f"An error occurred checking consent: {e}")
         return False
 
+if __name__ == "__main__":
+    # Expiry sidecar for when pg_cron is unavailable: run this as a single
+    # process (the web workers' timer is off unless RUN_SCHEDULER=1)
+    while True:
+        expire_tasks(int(os.getenv("MAX_TIME", "3600")))
+        time.sleep(300)
+
 #expire_tasks()
 #complete_task('9f28d264-434b-433d-abcf-4124bb97c019', '{"test": 1}', '1234')
 
@@ -0,0 +1,22 @@
+# Gunicorn settings, picked up automatically by `gunicorn main:app` (Procfile, Dockerfile)
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threaded workers: each worker loads the CSV and pre-renders the pages once,
+# then serves many requests concurrently while they wait on the database.
+# Keep threads at or below DB_POOL_MAXCONN (default 16).
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Reuse client / proxy connections between requests
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = 60
+
+
+def post_worker_init(worker):
+    # Load the CSV and render the study pages before the worker takes requests
+    import main
+
+    main.get_pages()
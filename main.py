@@ -2,22 +2,27 @@
 # dependencies = [
 #   "flask",
 #   "pandas",
-#   "apscheduler",
 #   "sqlalchemy",
 #   "psycopg2-binary",
 #   "uuid",
 #   "python-dotenv",
+#   "orjson",
 # ]
 # ///
 
 
 # Webapp for hosting Prolific surveys for the Edinburgh Napier University lab (reprohum project)
-import json
+import orjson
 from datetime import datetime
-from flask import Flask, render_template, request, render_template_string, redirect, url_for, send_file
+from flask import Flask, Response, jsonify, request, send_file
 import pandas as pd
 import ast
+import atexit
+import functools
 import os
+import queue
+import re
+import threading
 
 import DataManager as dm
 
@@ -25,28 +30,66 @@ MAX_TIME = 3600  # seconds
 # PROLIFIC_COMPLETION_URL='https://www.google.com'
 PROLIFIC_COMPLETION_URL = 'https://app.prolific.com/submissions/complete?cc=CZ3UY0IC'
 ##https://app.prolific.com/submissions/complete?cc=CZ3UY0IC
-# Load the data from CSV
-df = pd.read_csv("pivoted_output2.csv")
-column_names = df.columns.values.tolist()
+# Only the CSV columns the pages show (system_* / eid_* / list_id are never rendered)
+_PAGE_COLUMN_PREFIXES = ("text_", "triples_html_")
+
+# ${column_name} placeholders; other ${...} (the page's JavaScript) never match
+# a column and are left as they are
+_PLACEHOLDER_RE = re.compile(r"\$\{(\w+)\}")
 
 app = Flask(__name__)
 
+# === Write submissions to disk off the request thread ===
+# /submit queues (folder, file, payload) and returns once the task is completed
+# in the database; a daemon thread does the mkdir/open/write.
+_DATA_DIR = "data"
+os.makedirs(_DATA_DIR, exist_ok=True)
+_WRITE_Q = queue.Queue(maxsize=10000)
+# task_id / prolific_pid become path components, so only plain ids are accepted
+_SAFE_ID_RE = re.compile(r"[\w-]{1,64}", re.ASCII)
+
+
+def _drain_writes():
+    made_dirs = set()  # task folders this worker has already created
+    while True:
+        folder_path, file_path, payload = _WRITE_Q.get()
+        try:
+            if folder_path not in made_dirs:
+                os.makedirs(folder_path, exist_ok=True)
+                made_dirs.add(folder_path)
+            with open(file_path, "wb") as outfile:
+                outfile.write(payload)
+        except Exception:
+            # Keep draining: one bad entry must not strand every later write
+            app.logger.exception("Error writing %s", file_path)
+        finally:
+            _WRITE_Q.task_done()
+
+
+threading.Thread(target=_drain_writes, daemon=True).start()
+# Finish pending writes before the worker exits
+atexit.register(_WRITE_Q.join)
+
 
 # === Convert triplet list to HTML table ===
-def triplet_list_to_html(triplet_list):
-    table = "<table class='table table-striped small'><thead><tr><th>Entity 1</th><th>Relation</th><th>Entity 2</th></tr></thead><tbody>"
-    for t in triplet_list:
-        table += f"<tr><td>{t['subject']}</td><td>{t['predicate']}</td><td>{t['object']}</td></tr>"
-    table += "</tbody></table>"
-    return table
+_TRIPLET_TABLE_HEAD = "<table class='table table-striped small'><thead><tr><th>Entity 1</th><th>Relation</th><th>Entity 2</th></tr></thead><tbody>"
+_TRIPLET_TABLE_FOOT = "</tbody></table>"
+
 
+def triplet_list_to_html(triplet_list):
+    parts = [_TRIPLET_TABLE_HEAD]
+    parts.extend(
+        f"<tr><td>{t['subject']}</td><td>{t['predicate']}</td><td>{t['object']}</td></tr>"
+        for t in triplet_list
+    )
+    parts.append(_TRIPLET_TABLE_FOOT)
+    return "".join(parts)
 
 
-# === Replace placeholders in HTML with actual values ===
-def preprocess_html(html_content, row, task_id=-1):
+# === Values for a row's placeholders, with triplets rendered as HTML tables ===
+def row_values(row):
+    values = {}
     for column_name, value in row.items():
-        placeholder = f"${{{column_name}}}"
-
         if column_name.startswith("triples_html_"):
             try:
                 triplets = ast.literal_eval(value) if isinstance(value, str) else value
@@ -57,10 +100,89 @@ def preprocess_html(html_content, row, task_id=-1):
         else:
             html_value = str(value)
 
-        html_content = html_content.replace(placeholder, html_value)
+        values[column_name] = html_value
+
+    return values
+
+
+# === Turn ${column_name} placeholders into Jinja variables ===
+def to_jinja(template, column_names):
+    # Values are HTML and go in unescaped, as the old text substitution did.
+    # Row data is now passed to Jinja as variables, never parsed as template.
+    fields = set(column_names) | {"task_id"}
+    return _PLACEHOLDER_RE.sub(
+        lambda match: f"{{{{ {match.group(1)}|safe }}}}" if match.group(1) in fields else match.group(0),
+        template,
+    )
+
+
+# === Add the question cards for every text column to the study page ===
+def build_study_template(template, total_questions):
+    # Generate the question cards (templates/question_cards.html)
+    question_cards_html = app.jinja_env.get_template("question_cards.html").render(
+        total_questions=total_questions
+    )
+
+    # Replace the placeholder in the template with generated cards
+    template = template.replace("<!-- DYNAMIC_QUESTION_CARDS -->", question_cards_html)
+
+    # Update the total questions in JavaScript
+    template = template.replace(
+        "const totalQuestions = 32;", f"const totalQuestions = {total_questions};"
+    )
+    template = template.replace(
+        "out of 32 questions", f"out of {total_questions} questions"
+    )
+
+    return template
+
+
+# === Load the CSV and render every page, once per process ===
+# Deferred to first use so importing main stays cheap; gunicorn.conf.py calls
+# this as each worker starts, before it takes requests. Each page template is
+# compiled by Jinja once and the rows are fixed while the app runs, so /row and
+# /study serve the rendered strings. Only the hidden task-info inputs at the
+# end of the study page differ per participant; study() renders that small
+# tail and appends it.
+_TASK_INFO_MARKER = "<!-- Hidden inputs for task info -->"
+
+
+@functools.lru_cache(maxsize=None)
+def get_pages():
+    """Returns (row_pages, study_pages, task_info_template)."""
+    df = pd.read_csv(
+        "pivoted_output2.csv",
+        usecols=lambda column: column.startswith(_PAGE_COLUMN_PREFIXES),
+        dtype=str,
+    )
+    column_names = df.columns.values.tolist()
+    # The same rows as plain dicts; the DataFrame is not kept
+    rows = df.to_dict("records")
+    del df
+    # One question per text_XX column
+    total_questions = sum(col.startswith("text_") for col in column_names)
+
+    with open("templates/eval_template_v2.html", "r", encoding="utf-8") as f:
+        template = f.read()
+
+    study_body, _, task_info = build_study_template(template, total_questions).partition(_TASK_INFO_MARKER)
+    row_jinja = app.jinja_env.from_string(to_jinja(template, column_names))
+    study_jinja = app.jinja_env.from_string(to_jinja(study_body, column_names))
+    task_info_jinja = app.jinja_env.from_string(_TASK_INFO_MARKER + task_info)
+
+    # Every row's triplets are parsed and turned into tables once, for both pages.
+    # Pages are stored encoded, so responses send them without copying.
+    row_values_list = [row_values(row) for row in rows]
+    row_pages = [
+        row_jinja.render(values, task_id=str(row_id)).encode("utf-8")
+        for row_id, values in enumerate(row_values_list)
+    ]
+    study_pages = [
+        study_jinja.render(values, PROLIFIC_COMPLETION_URL=PROLIFIC_COMPLETION_URL).encode("utf-8")
+        for values in row_values_list
+    ]
+    return row_pages, study_pages, task_info_jinja
 
-    html_content = html_content.replace("${task_id}", str(task_id))
-    return html_content
 
 @app.route("/")
 def hello_world():
@@ -73,18 +195,24 @@ def hello_world():
 @app.route('/submit', methods=[ 'POST'])
 def index():
     if request.method == 'POST':
-        print(request.json)
-
-        task_id = request.json['task_id']
-        prolific_pid = request.json['prolific_pid']
-        folder_path = os.path.join('data', str(task_id))
-        os.makedirs(folder_path, exist_ok=True)
-
+        # The body is parsed with orjson, then goes to disk and to
+        # results.json_string as received, without re-encoding
+        payload = request.get_data()
+        try:
+            data = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return {"result": "Invalid JSON"}, 400
+
+        task_id = data.get('task_id') if isinstance(data, dict) else None
+        prolific_pid = data.get('prolific_pid') if isinstance(data, dict) else None
+        if not all(isinstance(v, str) and _SAFE_ID_RE.fullmatch(v) for v in (task_id, prolific_pid)):
+            return {"result": "Invalid task_id or prolific_pid"}, 400
+
+        folder_path = os.path.join(_DATA_DIR, task_id)
         file_path = os.path.join(folder_path, f"{task_id}.json")
-        with open(file_path, 'w') as outfile:
-            json.dump(request.json, outfile)
+        _WRITE_Q.put((folder_path, file_path, payload))
 
-        complete = dm.complete_task(task_id, str(request.json), prolific_pid)
+        complete = dm.complete_task(task_id, payload.decode(), prolific_pid)
 
         if complete == -1:
             return {"result": "Something went wrong? Is this your task?"}, 500
@@ -96,14 +224,11 @@ def index():
 
 @app.route('/row/<int:row_id>', methods=['GET'])
 def row(row_id):
-    if row_id >= len(df):
+    row_pages, _, _ = get_pages()
+    if row_id >= len(row_pages):
         return "Row ID out of range", 404
 
-    with open("templates/eval_template_v2.html", "r", encoding="utf-8") as f:
-        template = f.read()
-
-    processed_html = preprocess_html(template, df.iloc[row_id], task_id=row_id)
-    return render_template_string(processed_html)
+    return row_pages[row_id]
 
 @app.route("/store-consent", methods=["POST"])
 def store_consent():
@@ -169,7 +294,8 @@ def study():
     if prolific_pid is None or session_id is None:
         return "PROLIFIC_PID and SESSION_ID are required parameters.", 400
     
-    consent_given = dm.check_consent(prolific_pid, session_id)
+    # Only needed by the commented-out consent-card toggle below
+    # consent_given = dm.check_consent(prolific_pid, session_id)
 
     # task_id, task_number = dm.allocate_task(prolific_pid, session_id)
 
@@ -202,11 +328,8 @@ def study():
         return "No tasks available", 400
 
     # Use modulo to wrap around the DataFrame
-    df_row_index = task_number % len(df) if len(df) > 0 else 0
-
-    # Read the template
-    with open("templates/eval_template_v2.html", "r", encoding="utf-8") as f:
-        template = f.read()
+    _, study_pages, task_info_template = get_pages()
+    df_row_index = task_number % len(study_pages) if len(study_pages) > 0 else 0
 
     # if consent_given:
     #     template = template.replace(
@@ -216,101 +339,31 @@ def study():
     #         'id="intro-card" style="display:none;"', 'id="intro-card"'
     #     )
 
-    # Generate all 32 question cards dynamically
-    question_cards_html = ""
-
-    # Determine total questions based on CSV columns
-    text_columns = [col for col in df.columns if col.startswith("text_")]
-    total_questions = len(text_columns)
-
-    for i in range(1, total_questions + 1):
-        padded_num = str(i).zfill(2)  # Pad with zeros (01, 02, etc.)
-
-        # Determine navigation buttons
-        prev_button = f'<button class="btn btn-outline-secondary btn-nav prev-btn" {"disabled" if i == 1 else ""} onclick="showPrevQuestion()">Previous</button>'
-
-        if i == total_questions:
-            next_button = '<button class="btn btn-success btn-nav finish-btn" onclick="showSubmitCard()">Finish</button>'
-        else:
-            next_button = '<button class="btn btn-primary btn-nav next-btn" onclick="showNextQuestion()">Next</button>'
-
-        card_html = f"""
-        <!-- Question {i} -->
-        <div class="card intro-card question-card" id="question-card-{i}">
-            <div class="card-header">
-                <h5 class="mb-0">Question {i} of {total_questions}</h5>
-            </div>
-            <div class="card-body">
-                <div class="evaluation-box">
-                    <h6>Data:</h6>
-                    <div class="table-responsive">
-                        ${{triples_html_{padded_num}}}
-                    </div>
-                </div>
-                <div class="evaluation-box">
-                    <h6>Text to evaluate:</h6>
-                    <p class="lead">${{text_{padded_num}}}</p>
-                </div>
-                <div class="evaluation-box">
-                    <h6>Grammaticality:</h6>
-                    <p>Is the text grammatical (no spelling or grammatical errors)?</p>
-                    <div class="rating-container">
-                        <div class="rating-label">Very<br>Bad</div>
-                        <div class="rating-btn" data-value="1" data-name="grammar-item{i}">1</div>
-                        <div class="rating-btn" data-value="2" data-name="grammar-item{i}">2</div>
-                        <div class="rating-btn" data-value="3" data-name="grammar-item{i}">3</div>
-                        <div class="rating-btn" data-value="4" data-name="grammar-item{i}">4</div>
-                        <div class="rating-btn" data-value="5" data-name="grammar-item{i}">5</div>
-                        <div class="rating-btn" data-value="6" data-name="grammar-item{i}">6</div>
-                        <div class="rating-btn" data-value="7" data-name="grammar-item{i}">7</div>
-                        <div class="rating-label">Very<br>Good</div>
-                    </div>
-                </div>
-                
-                <div class="navigation-buttons">
-                    {prev_button}
-                    {next_button}
-                </div>
-                
-                <p class="swipe-hint mt-4">
-                    <small>Use the navigation buttons to move between questions</small>
-                </p>
-            </div>
-        </div>
-        """
-
-        question_cards_html += card_html
-
-    # Replace the placeholder in the template with generated cards
-    template = template.replace("<!-- DYNAMIC_QUESTION_CARDS -->", question_cards_html)
-
-    # Update the total questions in JavaScript
-    template = template.replace(
-        "const totalQuestions = 32;", f"const totalQuestions = {total_questions};"
+    # The page for this row was rendered at startup; only the task info is
+    # rendered per participant (and escaped, as it comes from the query string).
+    # The two parts are sent one after the other instead of being joined.
+    task_info = task_info_template.render(
+        prolific_pid=prolific_pid, session_id=session_id, task_id=task_id
     )
-    template = template.replace(
-        "out of 32 questions", f"out of {total_questions} questions"
+    html_content = Response(
+        [study_pages[df_row_index], task_info.encode("utf-8")], mimetype="text/html"
     )
 
-    # Process the template with CSV data
-    html_content = preprocess_html(template, df.iloc[df_row_index], task_id)
-
     # Add hidden form fields for task info but add it before the closing </form> tag
     # html_content += f'<input type="hidden" id="prolific_pid" value="{prolific_pid}">'
     # html_content += f'<input type="hidden" id="session_id" value="{session_id}">'
     # html_content += f'<input type="hidden" id="task_id" value="{task_id}">'
-    html_content = html_content.replace("prolific_pid_value", prolific_pid)
-    html_content = html_content.replace("session_id_value", session_id)
-    html_content = html_content.replace("task_id_value", str(task_id))
 
-    return render_template_string(
-        html_content, PROLIFIC_COMPLETION_URL=PROLIFIC_COMPLETION_URL
-    )
+    return html_content
 
 @app.route('/tasksallocated')
 def tasksallocated():
-    tasks = dm.get_all_tasks()
-    return tasks
+    limit = request.args.get("limit", 100, type=int)
+    offset = request.args.get("offset", 0, type=int)
+    tasks = dm.get_all_tasks(limit, offset)
+    if tasks is None:
+        return "Error reading tasks", 500
+    return jsonify([dict(zip(dm.TASK_COLUMNS, task)) for task in tasks])
 
 
 @app.route('/results/<task_id>')
@@ -324,8 +377,10 @@ def results(task_id):
 @app.route('/abdn')
 def check_abandonment():
     print("Checking for abandoned tasks...")
-    dm.expire_tasks(MAX_TIME)
-    return dm.get_all_tasks(), 200
+    expired = dm.expire_tasks(MAX_TIME)
+    if expired is None:
+        return {"result": "Error expiring tasks"}, 500
+    return {"expired": expired}, 200
 
 
 @app.route("/participant-information-sheet")
@@ -343,12 +398,24 @@ def participant_information_sheet():
         return "Participant information sheet not found", 404
 
 
-# === Scheduler: run check_abandonment every hour ===
-from apscheduler.schedulers.background import BackgroundScheduler
+# === Expire abandoned tasks every MAX_TIME seconds ===
+# Opt-in with RUN_SCHEDULER=1, set for a single process only: otherwise every
+# worker would run the same sweep. Leave it unset when the pg_cron job
+# (CreateDatabase.scheduleExpiry) or the DataManager.py sidecar expires tasks;
+# /abdn stays available as a manual trigger.
+def _expire_abandoned_tasks():
+    try:
+        dm.expire_tasks(MAX_TIME)
+    finally:
+        timer = threading.Timer(MAX_TIME, _expire_abandoned_tasks)
+        timer.daemon = True
+        timer.start()
+
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=check_abandonment, trigger="interval", seconds=MAX_TIME)
-scheduler.start()
+if os.getenv("RUN_SCHEDULER") == "1":
+    timer = threading.Timer(MAX_TIME, _expire_abandoned_tasks)
+    timer.daemon = True
+    timer.start()
 
 
 # === CLI Entry Point ===
@@ -1,14 +1,17 @@
-from bs4 import BeautifulSoup
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # optional, only this script uses it
+    raise SystemExit("read_html.py needs selectolax: pip install '.[html]'")
 import pandas as pd
 
 # Load the HTML file
 html_file = "/Users/vivian.fresen/prolifics_flaskServer/prolific-html-webapp/templates/list11.html"
 
 with open(html_file, "r", encoding="utf-8") as file:
-    soup = BeautifulSoup(file, "html.parser")
+    tree = HTMLParser(file.read())
 
 # Find all sections containing questions
-questions = soup.find_all("div", id=lambda x: x and x.startswith("item_"))
+questions = tree.css('div[id^="item_"]')
 
 data_list = []
 
@@ -16,19 +19,19 @@ data_list = []
 task_id = 1  # Initialize task counter
 for question in questions:
     # Extract the question number
-    question_number = question.find("h3").text.strip()
+    question_number = question.css_first("h3").text().strip()
     
     # Extract the table data
-    table = question.find("table")
-    rows = table.find_all("tr")
+    table = question.css_first("table")
+    rows = table.css("tr")
     
     table_data = []
     for row in rows:
-        cells = row.find_all("td")
-        table_data.append([cell.text.strip() for cell in cells])
+        cells = row.css("td")
+        table_data.append([cell.text().strip() for cell in cells])
 
     # Extract the corresponding text to evaluate
-    text_evaluate = question.find("div", id="article").find("h5").text.strip()
+    text_evaluate = question.css_first("div#article").css_first("h5").text().strip()
     
     # Flatten the table data and store the result
     for row in table_data:
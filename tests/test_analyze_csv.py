@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AnalyzeResults as ar  # noqa: E402
+
+pytestmark = pytest.mark.skipif(ar.pacsv is None, reason="pyarrow not installed")
+
+CSV_WITH_GAPS = (
+    "task_number,gender,age,score,flag,time_allocated,note\n"
+    "1,Male,30,4.5,True,2024-01-01 10:00:00,hello\n"
+    '2,,NA,,False,,"a,b"\n'
+    "3,NA,25,3.0,True,,\n"
+    "4,Female,,2.0,,2024-01-02 11:00:00,None\n"
+)
+
+
+def test_parse_csv_matches_read_csv_on_empty_cells(tmp_path):
+    csv_file = tmp_path / "results_analysis.csv"
+    csv_file.write_text(CSV_WITH_GAPS)
+    expected = pd.read_csv(csv_file)
+    pd.testing.assert_frame_equal(ar._parse_csv(str(csv_file)), expected)
+    # The Parquet copy written by the first read must round-trip too
+    pd.testing.assert_frame_equal(ar._read_export(str(csv_file)), expected)
+    pd.testing.assert_frame_equal(ar._read_export(str(csv_file)), expected)
+
+
+def test_export_writes_to_csv_text(tmp_path):
+    results_df = pd.DataFrame(
+        {
+            "task_number": [1, 2],
+            "task_id": ["t1", "t2"],
+            "prolific_id": ["p1", "p2"],
+            "session_id": ["s1", None],
+            "time_allocated": ["2024-01-01 10:00:00", None],
+            "status": ["completed", "completed"],
+            "result_id": ["r1", "r2"],
+            "json_string": [
+                '{"task_id": "t1", "demographics": {"gender": "Male"}, "q1": 4.5, "done": true, "note": "a,b"}',
+                '{"task_id": "t2", "demographics": {"gender": "Female"}, "q1": 3, "done": false, "note": "plain"}',
+            ],
+        }
+    )
+    output_file = tmp_path / "results_analysis.csv"
+    df = ar.export_to_csv(str(output_file), results_df=results_df)
+    assert output_file.read_bytes() == df.to_csv(index=False).encode()
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import orjson
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AnalyzeResults as ar  # noqa: E402
+
+pytestmark = pytest.mark.skipif(ar.pq is None, reason="pyarrow not installed")
+
+
+def _results(ratings_per_task):
+    rows = []
+    for task_number, ratings in ratings_per_task.items():
+        for i, rating in enumerate(ratings):
+            rows.append(
+                {
+                    "task_number": task_number,
+                    "task_id": f"t{task_number}-{i}",
+                    "result_id": f"r{task_number}-{i}",
+                    "prolific_id": f"p{i}",
+                    "json_string": orjson.dumps({"grammar-item1": rating}).decode(),
+                }
+            )
+    return rows
+
+
+def test_numeric_ratings_read_the_same_from_sidecar_and_csv(tmp_path):
+    csv_file = str(tmp_path / "aggregated_results.csv")
+    ar.export_aggregated_by_task(csv_file, all_results=_results({1: [1, 4, 5], 2: [2, 3]}))
+    assert os.path.exists(ar._rating_lists_file(csv_file))
+
+    df, _, cols, rating_lists = ar._load(csv_file)
+    col = cols[0]
+    np.testing.assert_array_equal(ar._all_matrix(df, col, rating_lists), ar._ratings_matrix(df[col]))
+    np.testing.assert_array_equal(ar._list_codes(rating_lists[col]), ar._rating_codes(df[col]))
+
+
+def test_non_numeric_ratings_skip_the_sidecar(tmp_path):
+    csv_file = str(tmp_path / "aggregated_results.csv")
+    ar.export_aggregated_by_task(csv_file, all_results=_results({1: [1, "bad"], 2: [2, 3]}))
+    assert not os.path.exists(ar._rating_lists_file(csv_file))
+
+    # Both analyses now take the CSV path, which rejects the rating
+    df, _, cols, rating_lists = ar._load(csv_file)
+    assert rating_lists is None
+    with pytest.raises(ValueError):
+        ar._all_matrix(df, cols[0], rating_lists)
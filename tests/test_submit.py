@@ -0,0 +1,41 @@
+import os
+import sys
+
+import orjson
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(main.dm, "complete_task", lambda task_id, json_string, prolific_pid: 1)
+    return main.app.test_client()
+
+
+def _submit(client, task_id, prolific_pid="pid1"):
+    body = orjson.dumps({"task_id": task_id, "prolific_pid": prolific_pid})
+    return client.post("/submit", data=body, content_type="application/json")
+
+
+def test_bad_submission_does_not_stop_later_writes(client, tmp_path):
+    assert _submit(client, "bad\u0000id").status_code == 400
+    assert _submit(client, "good-id").status_code == 200
+    main._WRITE_Q.join()
+    assert (tmp_path / "good-id" / "good-id.json").exists()
+
+
+def test_writer_survives_unwritable_entry(client, tmp_path):
+    # Bypass /submit's validation to hit the writer thread directly
+    main._WRITE_Q.put((str(tmp_path / "bad\u0000id"), str(tmp_path / "bad\u0000id" / "x.json"), b"{}"))
+    assert _submit(client, "after-bad").status_code == 200
+    main._WRITE_Q.join()
+    assert (tmp_path / "after-bad" / "after-bad.json").exists()
+
+
+@pytest.mark.parametrize("task_id", ["../escape", "a/b", "", 5, None])
+def test_submit_rejects_unsafe_ids(client, task_id):
+    assert _submit(client, task_id).status_code == 400